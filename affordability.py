@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import ALL_LEVELS, DEFAULT_LEVELS
+
+# Store datasets joined on the territory x year grid
+SOURCES = {
+    'income': 'income',
+    'rent': 'rental_price',
+    'price': 'transaction_price',
+    'population': 'population',
+    'unemployment': 'unemployment',
+    'transactions': 'transactions',
+}
+# Size of the flat the price and rent ratios are quoted for
+FLAT_AREA = 70
+RATIOS = {
+    'price_to_income': f'Price-to-income (years, {FLAT_AREA} m²)',
+    'rent_to_income': f'Rent-to-income (%, {FLAT_AREA} m²)',
+    'transactions_per_1000': 'Transactions per 1,000 residents',
+    'unemployed_per_1000': 'Unemployed per 1,000 residents',
+}
+LABELS = {
+    'income': 'Income (€)',
+    'rent': 'Rent (€/m²)',
+    'price': 'Price (€/m²)',
+    'population': 'Population',
+    'unemployment': 'Unemployed',
+    'transactions': 'Transactions',
+    **RATIOS,
+}
+
+_lock = threading.Lock()
+_matrices = {}
+
+
+def pairwise_correlation(values):
+    """Pearson correlation between the rows of a metric x observation array.
+
+    Each pair uses the observations where both are known, computed for all pairs
+    at once from masked sums.
+    """
+    observed = ~np.isnan(values)
+    mask = observed.astype(float)
+    x = np.where(observed, values, 0.0)
+    n = mask @ mask.T
+    # sums[i, j]: sum of metric i over the observations where j is known too
+    sums = x @ mask.T
+    squares = (x ** 2) @ mask.T
+    products = x @ x.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - sums * sums.T / n
+        variance = squares - sums ** 2 / n
+        correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[(n < 3) | ~np.isfinite(correlation)] = np.nan
+    return np.clip(correlation, -1, 1)
+
+
+class AffordabilityMatrix:
+    """Every dataset and the ratios between them on one territory x year grid.
+
+    Income is the mean gross income per person, so the ratios compare the cost of
+    a `FLAT_AREA` m² flat with one person's income. Cells where any input is
+    missing are NaN (income is only published for the city and its districts).
+    """
+
+    def __init__(self, territories, levels, years, sources):
+        self.territories = list(territories)
+        self.index = {territory: row for row, territory in enumerate(self.territories)}
+        self.levels = np.asarray(levels, dtype=object)
+        self.years = np.asarray(years)
+        self.metrics = {}
+        for name, values in sources.items():
+            self.metrics[name] = np.array(values, dtype=float)
+
+        m = self.metrics
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m['price_to_income'] = m['price'] * FLAT_AREA / m['income']
+            m['rent_to_income'] = m['rent'] * FLAT_AREA * 12 / m['income'] * 100
+            m['transactions_per_1000'] = m['transactions'] / m['population'] * 1000
+            m['unemployed_per_1000'] = m['unemployment'] / m['population'] * 1000
+        for values in m.values():
+            values[~np.isfinite(values)] = np.nan
+            values.setflags(write=False)
+
+        self._correlations = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, territory):
+        return territory in self.index
+
+    def rows(self, levels=DEFAULT_LEVELS):
+        return np.flatnonzero(np.isin(self.levels, list(levels)))
+
+    def frame(self, metric, territories):
+        """Year x Territory frame of one metric for the given territories."""
+        rows = [self.index[territory] for territory in territories if territory in self.index]
+        frame = pd.DataFrame(self.metrics[metric][rows].T, index=pd.Index(self.years, name='Year'),
+                             columns=pd.Index([self.territories[row] for row in rows], name='Territory'))
+        return frame.dropna(how='all')
+
+    def latest_table(self, levels=DEFAULT_LEVELS, metrics=tuple(RATIOS)):
+        """Each territory's latest known value of every ratio (vectorized per metric)."""
+        rows = self.rows(levels)
+        columns = {}
+        for metric in metrics:
+            values = self.metrics[metric][rows]
+            valid = ~np.isnan(values)
+            last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+            columns[LABELS[metric]] = np.where(valid.any(axis=1), values[np.arange(len(rows)), last], np.nan)
+        table = pd.DataFrame(columns, index=pd.Index([self.territories[row] for row in rows], name='Territory'))
+        return table.dropna(axis=1, how='all')
+
+    def correlation(self, levels=DEFAULT_LEVELS, metrics=tuple(LABELS)):
+        """Correlation matrix of the metrics over every territory-year of `levels` (cached, read-only)."""
+        key = (tuple(levels), tuple(metrics))
+        with self._lock:
+            if key not in self._correlations:
+                rows = self.rows(levels)
+                values = np.stack([self.metrics[metric][rows].ravel() for metric in metrics])
+                labels = [LABELS[metric] for metric in metrics]
+                frame = pd.DataFrame(pairwise_correlation(values), index=labels, columns=labels)
+                self._correlations[key] = frame.dropna(how='all').dropna(axis=1, how='all')
+            return self._correlations[key]
+
+
+def build_affordability(store):
+    frames = {name: store.series(source, levels=ALL_LEVELS, freq='A', how='first')
+              for name, source in SOURCES.items()}
+    territories = pd.Index([])
+    years = pd.Index([])
+    for frame in frames.values():
+        territories = territories.union(frame.columns, sort=False)
+        years = years.union(frame.index.year)
+    levels = store.territory_table().set_index('territory')['level'].reindex(territories).to_numpy()
+    sources = {}
+    for name, frame in frames.items():
+        frame = frame.set_axis(frame.index.year, axis=0)
+        sources[name] = frame.reindex(index=years, columns=territories).to_numpy(dtype=float).T
+    return AffordabilityMatrix(territories, levels, years, sources)
+
+
+def affordability_matrix(store):
+    """Cached cross-dataset grid; rebuilt only when one of its source exports changes."""
+    digests = tuple(store.digests[source] for source in SOURCES.values())
+    with _lock:
+        if digests not in _matrices:
+            _matrices.clear()
+            _matrices[digests] = build_affordability(store)
+        return _matrices[digests]
@@ -0,0 +1,306 @@
+"""Read-only JSON API over the same precomputed indicators as the dashboard.
+
+    python api.py --port 8000                 # needs uvicorn
+    uvicorn api:app --workers 2               # or any other ASGI server
+
+    GET  /indicators                          indicator keys, titles and units
+    GET  /territories?level=Barri&district=Gràcia
+    GET  /series/<indicator>?territory=Gràcia&territory=Barcelona&from=2015&to=2024
+    GET  /series/<indicator>?level=Districte&values=0      CAGR etc. of every district, no series
+    GET  /series/<indicator>/<territory>?freq=M&how=mean&relative=1
+    POST /batch   {"queries": [{"indicator": "roi", "level": ["Barri"]}, ...]}
+    GET  /quality                             the ingest-time validation report
+    GET  /health                              data versions and cache counters
+
+Series endpoints return each territory's values with the CAGR, total change,
+average change and average level over the requested years (see
+IndicatorMatrix.window_stats), NaN as null. `typology` selects property uses
+of transactions. Responses carry an ETag derived from the data version of the
+indicator and the normalised query, so revalidation (If-None-Match) is
+answered with 304 before anything is computed; bodies are kept in an
+in-process LRU cache shared by all requests.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from urllib.parse import parse_qs, unquote
+
+import numpy as np
+
+from data_loader import ALL_LEVELS, DEFAULT_LEVELS, DEFAULT_TYPOLOGY
+from data_store import load_store
+from figure_cache import LRUCache
+from indicator_cube import load_cube
+from indicators import AGGREGATIONS, INDICATORS, PANELS
+from validation import summary_frame
+
+# Bump when the response layout changes so clients drop their cached copies
+API_VERSION = 1
+# Memory cap for cached response bodies, in MB
+DEFAULT_MAX_MB = float(os.environ.get('API_CACHE_MAX_MB', 32))
+# Queries per /batch request
+MAX_BATCH = 50
+ENDPOINTS = ['GET /indicators', 'GET /territories', 'GET /series/<indicator>', 'GET /series/<indicator>/<territory>',
+             'POST /batch', 'GET /quality', 'GET /health']
+
+responses = LRUCache(int(DEFAULT_MAX_MB * 1024 * 1024))
+
+
+class QueryError(Exception):
+    """A request that cannot be answered; `status` is the HTTP status to reply with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def nullable(values, digits=6):
+    # JSON has no NaN: missing values become null
+    values = np.round(np.asarray(values, dtype=float), digits)
+    return [None if np.isnan(value) else float(value) for value in values.ravel()]
+
+
+def first_value(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def year_param(params, name):
+    value = first_value(params, name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"'{name}' must be a year, not {value!r}")
+
+
+def normalise_query(cube, indicator, params):
+    """Validated series query as a plain dict, the same for every spelling of the same request."""
+    if indicator not in INDICATORS:
+        raise QueryError(f'Unknown indicator {indicator!r}; see /indicators', 404)
+    spec = INDICATORS[indicator]
+    freq = first_value(params, 'freq', 'A')
+    if freq not in spec.resolutions:
+        raise QueryError(f"{indicator} is available at freq {', '.join(spec.resolutions)}")
+    how = first_value(params, 'how', spec.aggregation)
+    if how not in AGGREGATIONS:
+        raise QueryError(f"'how' must be one of {', '.join(AGGREGATIONS)}")
+    # Repeated territory= params, never split: some barri names contain commas
+    territories = [name for name in params.get('territory', []) if name]
+    levels = params.get('level') or ([] if territories else list(DEFAULT_LEVELS))
+    unknown_levels = set(levels) - set(ALL_LEVELS)
+    if unknown_levels:
+        raise QueryError(f"Unknown level(s) {', '.join(sorted(unknown_levels))}; use {', '.join(ALL_LEVELS)}")
+    typologies = [DEFAULT_TYPOLOGY]
+    if spec.by_typology and params.get('typology'):
+        typologies = sorted(dict.fromkeys(params['typology']))
+        valid = cube.typology(spec.key).typologies
+        unknown = [typology for typology in typologies if typology not in valid]
+        if unknown:
+            raise QueryError(f"Unknown typology {', '.join(unknown)}; use {', '.join(valid)}")
+    start, end = year_param(params, 'from'), year_param(params, 'to')
+    return {
+        'indicator': indicator,
+        'territories': territories,
+        'levels': sorted(levels),
+        'district': first_value(params, 'district'),
+        'freq': freq,
+        'how': how,
+        'typologies': typologies,
+        'from': start,
+        'to': end,
+        'relative': first_value(params, 'relative', '0').lower() in ('1', 'true', 'yes'),
+        'values': first_value(params, 'values', '1').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def series_result(cube, query):
+    """Values and window statistics of many territories of one indicator, computed in bulk."""
+    spec = INDICATORS[query['indicator']]
+    matrix = cube.matrix(spec.key, query['freq'], query['how'], query['typologies'])
+    territories = query['territories'] or cube.territories(query['levels'], district=query['district'])
+    unknown = [territory for territory in territories if territory not in matrix]
+    if query['territories'] and unknown:
+        raise QueryError(f"No {spec.key} data for {', '.join(unknown)}; see /territories", 404)
+    territories = [territory for territory in territories if territory in matrix]
+
+    rows = np.array([matrix.index[territory] for territory in territories], dtype=int)
+    window = matrix.window(query['from'], query['to'])
+    lo, hi = window if window is not None else (0, len(matrix.dates) - 1)
+    stats = matrix.window_stats(rows, window)
+    last = matrix.span(rows, window)[1]
+    latest = np.where(last >= 0, matrix.values[rows, np.maximum(last, 0)], np.nan)
+    values = (matrix.relative if query['relative'] else matrix.values)[rows, lo:hi + 1]
+
+    result = {
+        'indicator': spec.key,
+        'title': spec.title,
+        'unit': spec.y_axis_title,
+        'is_rate': spec.is_rate,
+        'freq': query['freq'],
+        'how': query['how'],
+        'from': query['from'],
+        'to': query['to'],
+        'version': cube.versions[spec.key],
+    }
+    if spec.by_typology:
+        result['typologies'] = query['typologies']
+    if query['values']:
+        result['dates'] = [f'{date:%Y-%m-%d}' for date in matrix.dates[lo:hi + 1]]
+    result['territories'] = {}
+    columns = {name: nullable(column) for name, column in stats.items()}
+    columns['latest'] = nullable(latest)
+    for position, territory in enumerate(territories):
+        entry = {name: column[position] for name, column in columns.items()}
+        entry['latest_date'] = f'{matrix.dates[last[position]]:%Y-%m-%d}' if last[position] >= 0 else None
+        if query['values']:
+            entry['values'] = nullable(values[position])
+        result['territories'][territory] = entry
+    return result
+
+
+def indicators_result():
+    return {'indicators': [{'key': spec.key, 'title': spec.title, 'unit': spec.y_axis_title,
+                            'sources': list(spec.sources), 'resolutions': list(spec.resolutions),
+                            'is_rate': spec.is_rate, 'by_typology': spec.by_typology} for spec in PANELS],
+            'aggregations': list(AGGREGATIONS)}
+
+
+def territories_result(cube, params):
+    levels = params.get('level') or list(ALL_LEVELS)
+    district = first_value(params, 'district')
+    return {'territories': [{'territory': territory, 'level': cube.levels[territory],
+                             'district': cube.districts[territory]}
+                            for territory in cube.territories(levels, district=district)]}
+
+
+def quality_result(store):
+    return {'summary': summary_frame(store.quality).reset_index().to_dict(orient='records'),
+            'datasets': store.quality}
+
+
+def health_result(cube):
+    return {'version': cube.version, 'indicators': cube.versions, 'years': list(cube.years),
+            'response_cache': responses.stats()}
+
+
+def resolve(method, path, params, body):
+    """(etag key, builder) for a request; the builder is only called on a cache miss."""
+    parts = [unquote(part) for part in path.strip('/').split('/') if part]
+    cube = load_cube(load_store())
+    if method == 'POST' and parts == ['batch']:
+        try:
+            queries = json.loads(body or b'{}')['queries']
+        except (ValueError, KeyError, TypeError):
+            raise QueryError('Expected a JSON body {"queries": [...]}')
+        if not isinstance(queries, list) or len(queries) > MAX_BATCH:
+            raise QueryError(f"'queries' must be a list of at most {MAX_BATCH} queries")
+        normalised = []
+        for query in queries:
+            if not isinstance(query, dict):
+                raise QueryError('Each query must be an object')
+            # Same parameters as the query string, as single values or lists
+            params = {name: [str(item) for item in (value if isinstance(value, list) else [value])]
+                      for name, value in query.items() if name != 'indicator'}
+            normalised.append(normalise_query(cube, str(query.get('indicator')), params))
+        versions = [cube.versions[query['indicator']] for query in normalised]
+        return ('batch', versions, normalised), lambda: {
+            'results': [series_result(cube, query) for query in normalised]}
+    if method != 'GET':
+        raise QueryError(f'{method} is not supported here', 405)
+    if parts == []:
+        return ('index',), lambda: {'endpoints': ENDPOINTS}
+    if parts == ['indicators']:
+        return ('indicators',), indicators_result
+    if parts == ['territories']:
+        return ('territories', cube.version, sorted(params.items())), lambda: territories_result(cube, params)
+    if parts == ['quality']:
+        return ('quality', cube.version), lambda: quality_result(cube.store)
+    if parts == ['health']:
+        # Live counters: never cached
+        return None, lambda: health_result(cube)
+    if parts and parts[0] == 'series' and len(parts) in (2, 3):
+        if len(parts) == 3:
+            params = {**params, 'territory': [parts[2]]}
+        query = normalise_query(cube, parts[1], params)
+        return ('series', cube.versions[parts[1]], query), lambda: series_result(cube, query)
+    raise QueryError(f'No endpoint at {path}', 404)
+
+
+def etag_of(key):
+    payload = json.dumps([API_VERSION, key], sort_keys=True, default=str).encode()
+    return '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+
+
+def respond(method, path, query_string, headers, body=b''):
+    """(status, headers, body) of one request; runs in a worker thread."""
+    params = parse_qs(query_string, keep_blank_values=False)
+    try:
+        key, build = resolve(method, path, params, body)
+        if key is None:
+            return 200, [(b'cache-control', b'no-store')], json.dumps(build()).encode()
+        etag = etag_of(key)
+        response_headers = [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+        if etag in [tag.strip() for tag in headers.get(b'if-none-match', b'').decode().split(',')]:
+            return 304, response_headers, b''
+        content = responses.get(etag)
+        if content is None:
+            content = json.dumps(build(), ensure_ascii=False, allow_nan=False).encode()
+            responses.put(etag, content, len(content))
+        return 200, response_headers, content
+    except QueryError as error:
+        return error.status, [], json.dumps({'error': str(error)}).encode()
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Load the snapshot and build the cube before the first request
+                await asyncio.get_running_loop().run_in_executor(None, lambda: load_cube(load_store()))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive) if scope['method'] == 'POST' else b''
+    headers = dict(scope['headers'])
+    status, response_headers, content = await asyncio.get_running_loop().run_in_executor(
+        None, respond, scope['method'], scope['path'], scope['query_string'].decode(), headers, body)
+    if status != 304:
+        response_headers = response_headers + [(b'content-type', b'application/json; charset=utf-8'),
+                                               (b'content-length', str(len(content)).encode())]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': content if status != 304 else b''})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the indicators as a read-only JSON API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error('serving needs the uvicorn package (pip install uvicorn), or run api:app with any ASGI server')
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
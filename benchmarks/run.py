@@ -0,0 +1,218 @@
+"""Time the dashboard's load, transform and render hot paths.
+
+    python -m benchmarks.run                      # bundled data + 10x/100x synthetic data
+    python -m benchmarks.run --quick              # bundled data + 10x only
+    python -m benchmarks.run --compare latest     # flag regressions against the last saved run
+
+Every stage is called through the same functions the app uses, bypassing the
+process-wide caches so each repeat does the full work. The Streamlit runs use
+AppTest against the bundled data only, since the app always reads data/.
+Results are written to benchmarks/results/<timestamp>.json.
+"""
+import argparse
+import glob
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.synthetic import write_synthetic
+from data_loader import ALL_LEVELS, DATA_DIR, DATASETS, dataset_path, read_statistical_table
+from data_store import IndicatorStore, build_table, current_digests, read_snapshot, write_snapshot
+from indicator_cube import IndicatorCube, build_matrix
+from indicators import PANELS
+from panels import panel_figure
+from ranking import build_ranking
+from yields import clear_cache as clear_yields
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+APP_PATH = os.path.join(ROOT_DIR, 'streamlit_app.py')
+
+
+def measure(function, repeat=5, setup=None):
+    """Wall-clock statistics (seconds) of `repeat` calls; `setup()` runs untimed before each call."""
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument) if setup else function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'max': max(timings), 'repeat': repeat}
+
+
+def fresh_store(table, digests):
+    # A new store has empty frame caches, so pivots and resampling are redone
+    return IndicatorStore(table, digests, {})
+
+
+def data_benchmarks(data_dir, repeat):
+    """Ingest, transform, matrix, ranking and figure timings for one data directory."""
+    results = {}
+    results['load_csv'] = measure(
+        lambda: [read_statistical_table(dataset_path(name, data_dir=data_dir)) for name in DATASETS], repeat)
+    results['tidy_table'] = measure(lambda: build_table(data_dir=data_dir), repeat)
+
+    table = build_table(data_dir=data_dir)
+    digests = current_digests(data_dir=data_dir)
+    store = fresh_store(table, digests)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'indicators.arrow')
+        results['snapshot_write'] = measure(lambda: write_snapshot(store, path), repeat)
+        results['snapshot_read'] = measure(lambda: read_snapshot(path), repeat)
+
+    # Territory/level filtering and pivoting, then collapsing periods to years
+    results['filter_pivot'] = measure(
+        lambda store: [store.wide(name, levels=ALL_LEVELS) for name in DATASETS], repeat,
+        setup=lambda: fresh_store(table, digests))
+
+    def pivoted():
+        store = fresh_store(table, digests)
+        for name in DATASETS:
+            store.wide(name, levels=ALL_LEVELS)
+        return store
+
+    results['resample_annual'] = measure(
+        lambda store: [store.series(name, levels=ALL_LEVELS, freq='A', how='first') for name in DATASETS], repeat,
+        setup=pivoted)
+
+    # Matrix construction covers relative change, CAGR and the ROI ratio; ROI and net yield
+    # share the cached yields, which are dropped before every call so neither times a cache hit
+    for spec in PANELS:
+        results[f'matrix[{spec.key}]'] = measure(lambda _, spec=spec: build_matrix(store, spec), repeat,
+                                                 setup=clear_yields)
+
+    cube = IndicatorCube(store)
+    results['ranking'] = measure(lambda: build_ranking(cube, ALL_LEVELS), repeat)
+    # Window statistics of every territory for a fixed year range, from the prefix arrays
+    results['window_stats'] = measure(
+        lambda: [matrix.window_stats(np.arange(len(matrix.territories)), matrix.window(2015, 2020))
+                 for matrix in cube.matrices.values()], repeat)
+    territory = next(territory for territory, level in cube.levels.items() if level == 'Districte')
+    for spec in PANELS:
+        matrix = cube[spec.key]
+        results[f'figure[{spec.key}]'] = measure(lambda spec=spec, matrix=matrix: panel_figure(spec, matrix, territory),
+                                                 repeat)
+    results['shape'] = {'rows': len(table), 'territories': len(cube.levels),
+                        'periods': int(table['date'].nunique())}
+    return results
+
+
+def app_benchmarks(repeat):
+    """Headless runs of streamlit_app.py: first run, warm rerun and widget interactions."""
+    from streamlit.testing.v1 import AppTest
+
+    logging.disable(logging.WARNING)
+
+    def new_app():
+        return AppTest.from_file(APP_PATH, default_timeout=300)
+
+    results = {'app_first_run': measure(lambda: new_app().run(), 1)}
+    results['app_session_run'] = measure(lambda: new_app().run(), repeat)
+
+    app = new_app().run()
+    results['app_rerun'] = measure(lambda: app.run(), repeat)
+    districts = app.selectbox(key='selected_district').options
+    picks = itertools.cycle(districts[1:] + districts[:1])
+    results['app_switch_district'] = measure(
+        lambda district: app.selectbox(key='selected_district').set_value(district).run(), repeat,
+        setup=lambda: next(picks))
+    results['app_relative_change'] = measure(
+        lambda _: app.checkbox(key='show_relative_change').check().run(), repeat,
+        setup=lambda: app.checkbox(key='show_relative_change').uncheck().run())
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_result():
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    return paths[-1] if paths else None
+
+
+def compare(current, baseline, threshold):
+    """Print median ratios against a baseline run; returns the benchmarks slower than `threshold`."""
+    regressions = []
+    for suite, results in current['suites'].items():
+        previous = baseline['suites'].get(suite, {})
+        for name, stats in results.items():
+            if name == 'shape' or name not in previous:
+                continue
+            ratio = stats['median'] / previous[name]['median'] if previous[name]['median'] else float('nan')
+            flag = '  <-- slower' if ratio > threshold else ''
+            print(f'{suite:<40} {name:<28} {previous[name]["median"] * 1000:10.2f} ms -> '
+                  f'{stats["median"] * 1000:10.2f} ms  x{ratio:.2f}{flag}')
+            if ratio > threshold:
+                regressions.append((suite, name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard hot paths.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scales', type=int, nargs='*', default=[10, 100],
+                        help='synthetic scale factors, applied to territories and to periods separately')
+    parser.add_argument('--quick', action='store_true', help='shorthand for --scales 10 --repeat 3')
+    parser.add_argument('--no-app', action='store_true', help='skip the AppTest runs')
+    parser.add_argument('--compare', metavar='RESULT', help="earlier result file to compare with, or 'latest'")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='median ratio above which a benchmark counts as a regression')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.scales, args.repeat = [10], 3
+
+    baseline_path = latest_result() if args.compare == 'latest' else args.compare
+    suites = {'bundled': data_benchmarks(DATA_DIR, args.repeat)}
+    if not args.no_app:
+        suites['app'] = app_benchmarks(args.repeat)
+    for factor in args.scales:
+        for territories, periods in ((factor, 1), (1, factor)):
+            data_dir = write_synthetic(territory_factor=territories, period_factor=periods)
+            # 100x sets take seconds per stage; one repeat is enough to see the scaling
+            suites[f'synthetic territories {territories}x periods {periods}x'] = data_benchmarks(
+                data_dir, args.repeat if factor < 100 else 1)
+        print(f'finished {factor}x synthetic suites', file=sys.stderr)
+
+    result = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'suites': suites,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f'{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(result, handle, indent=2)
+
+    for suite, results in suites.items():
+        for name, stats in results.items():
+            if name != 'shape':
+                print(f'{suite:<40} {name:<28} {stats["median"] * 1000:10.2f} ms (min {stats["min"] * 1000:.2f})')
+    print(f'Wrote {output}')
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as handle:
+            regressions = compare(result, json.load(handle), args.threshold)
+        if regressions:
+            sys.exit(f'{len(regressions)} benchmark(s) slower than x{args.threshold} of {baseline_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_DIR, DATASETS, dataset_path, parse_period, period_columns
+
+SYNTHETIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+
+def scale_territories(table, factor, rng):
+    """Repeat the whole export `factor` times with renamed, jittered copies.
+
+    Copies keep the district-then-barris row order, so parent districts still
+    resolve. Copy i prefixes every territory with 'Ci ' (a prefix, so suffixes
+    such as ' (District)' are still recognised).
+    """
+    periods = period_columns(table)
+    values = table[periods].apply(pd.to_numeric, errors='coerce')
+    copies = [table]
+    for copy in range(1, factor):
+        scaled = table.copy()
+        scaled['Territory'] = f'C{copy} ' + scaled['Territory']
+        jittered = (values * rng.normal(1, 0.05, size=values.shape)).round(3)
+        scaled[periods] = jittered.astype(object).where(values.notna(), '..')
+        copies.append(scaled)
+    return pd.concat(copies, ignore_index=True)
+
+
+def scale_periods(table, factor, rng):
+    """Prepend (factor - 1) x as many daily periods before the earliest one, as the loader would see them."""
+    periods = period_columns(table)
+    first = min(parse_period(period) for period in periods)
+    extra = pd.date_range(end=first - pd.Timedelta(days=1), periods=len(periods) * (factor - 1), freq='D')
+    # Noise around each row's mean, missing for rows without any data
+    values = table[periods].apply(pd.to_numeric, errors='coerce').mean(axis=1).to_numpy()
+    noise = rng.normal(1, 0.02, size=(len(table), len(extra)))
+    history = pd.DataFrame(np.round(values[:, None] * noise, 3), columns=[date.strftime('%d %b %Y') for date in extra])
+    history = history.astype(object).where(np.broadcast_to(~np.isnan(values)[:, None], history.shape), '..')
+    ids = table.drop(columns=periods)
+    return pd.concat([ids, history, table[periods]], axis=1)
+
+
+def write_synthetic(territory_factor=1, period_factor=1, seed=0, data_dir=DATA_DIR, target_dir=None):
+    """Write a scaled copy of every export (plus metadata) and return its data directory."""
+    target_dir = target_dir or os.path.join(SYNTHETIC_DIR, f'territories-{territory_factor}x-periods-{period_factor}x')
+    rng = np.random.default_rng(seed)
+    for name in DATASETS:
+        source = dataset_path(name, data_dir=data_dir)
+        target = dataset_path(name, data_dir=target_dir)
+        if os.path.exists(target):
+            continue
+        table = pd.read_csv(source, dtype=str, keep_default_na=False)
+        if territory_factor > 1:
+            table = scale_territories(table, territory_factor, rng)
+        if period_factor > 1:
+            table = scale_periods(table, period_factor, rng)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        table.to_csv(target, index=False)
+        shutil.copy(dataset_path(name, 'Metadata.txt', data_dir=data_dir),
+                    dataset_path(name, 'Metadata.txt', data_dir=target_dir))
+    return target_dir
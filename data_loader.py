@@ -0,0 +1,181 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Location of the portaldades exports, one folder per dataset
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+DATASETS = {
+    'population': 'population',
+    'unemployment': 'unemployment',
+    'income': 'Mean gross income per person (€)',
+    'transactions': 'number of transactions',
+    'rental_price': 'average rental price per area (€_m²)',
+    'transaction_price': 'average transaction price per surface area (€_m²)',
+}
+
+ID_COLUMNS = ['Territory', 'Location type', 'District', 'Property use typology']
+DEFAULT_LEVELS = ('Districte', 'Municipi')
+DEFAULT_TYPOLOGY = 'Residential'
+
+# Cell status codes: '-' marks a missing value, '..' a value suppressed for privacy (see Metadata.txt)
+VALID, MISSING, SUPPRESSED, INVALID = 0, 1, 2, 3
+MISSING_TEXT = ('-', '')
+SUPPRESSED_TEXT = '..'
+
+ALL_LEVELS = ('Municipi', 'Districte', 'Barri')
+
+# Some exports tag a territory with its level instead of filling in 'Location type'
+# ("Sant Andreu (District)") or spell district names differently ("L'Eixample").
+# The barri keeps a suffix so it does not collide with the district of the same name.
+TERRITORY_SUFFIXES = {
+    ' (District)': ('Districte', ''),
+    ' (Neighborhood)': ('Barri', ' (Barri)'),
+    ' (Neighbourhood)': ('Barri', ' (Barri)'),
+}
+TERRITORY_ALIASES = {
+    "L'Eixample": 'Eixample',
+    'el Poble Sec - AEI Parc Montjuïc': 'el Poble-sec',
+    'el Poble Sec - AEI Parc de Montjuïc': 'el Poble-sec',
+    'la Marina del Prat Vermell - AEI Zona Franca': 'la Marina del Prat Vermell',
+}
+# Registrations without a known address; not a real territory at any level
+UNASSIGNED_TERRITORIES = ('No consta', 'No consta (Barri)')
+
+_lock = threading.Lock()
+_digests = {}
+_tables = {}
+
+
+def dataset_path(name, filename='Statistical table.csv', data_dir=DATA_DIR):
+    return os.path.join(data_dir, DATASETS[name], filename)
+
+
+def parse_period(label):
+    # Annual exports use '2015', daily/monthly ones '01 Jan 2016' or '31 Jan 2005'
+    label = str(label).strip()
+    if label.isdigit():
+        return pd.Timestamp(year=int(label), month=1, day=1)
+    return pd.to_datetime(label, format='%d %b %Y')
+
+
+def period_columns(table):
+    return [col for col in table.columns if col not in ID_COLUMNS]
+
+
+def normalize_territories(table):
+    territory = table['Territory'].str.strip()
+    level = table['Location type'].str.strip()
+    for suffix, (suffix_level, replacement) in TERRITORY_SUFFIXES.items():
+        tagged = territory.str.endswith(suffix)
+        territory = territory.where(~tagged, territory.str[:-len(suffix)] + replacement)
+        level = level.where(~tagged, suffix_level)
+    territory = territory.replace(TERRITORY_ALIASES)
+    level = level.where(~territory.isin(UNASSIGNED_TERRITORIES), '-')
+    table['Territory'] = territory
+    table['Location type'] = level
+    # Exports list each district followed by its barris; remember the parent
+    district = territory.where(level == 'Districte').ffill()
+    table.insert(2, 'District', district.where(level.isin(['Districte', 'Barri'])))
+    return table
+
+
+def classify(raw):
+    """Float values and status codes of an array of raw cell strings."""
+    text = np.char.strip(raw.astype(str))
+    values = pd.to_numeric(pd.Series(text.ravel()), errors='coerce').to_numpy(dtype=float).reshape(text.shape)
+    status = np.select([np.isin(text, MISSING_TEXT), text == SUPPRESSED_TEXT, np.isnan(values)],
+                       [MISSING, SUPPRESSED, INVALID], VALID).astype(np.int8)
+    return np.where(status == VALID, values, np.nan), status
+
+
+def parse_statistical_table(path):
+    """Parse one portaldades export into string id columns and float period columns, plus the
+    row x period status code of every cell (see classify)."""
+    table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    periods = period_columns(table)
+    ids = normalize_territories(table.drop(columns=periods))
+    values, status = classify(table[periods].to_numpy())
+    status.setflags(write=False)
+    return pd.concat([ids, pd.DataFrame(values, index=table.index, columns=periods)], axis=1), status
+
+
+def read_statistical_table(path):
+    """The parsed frame of an export, without its cell status codes."""
+    return parse_statistical_table(path)[0]
+
+
+def read_metadata(path):
+    """Parse a portaldades Metadata.txt into a flat dict of lower-cased keys."""
+    metadata = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.strip()
+            if line.startswith('[meta_filters_type]'):
+                for part in line[len('[meta_filters_type]'):].split(';'):
+                    key, _, value = part.partition(':')
+                    metadata['filter ' + key.strip().lower()] = value.strip()
+                continue
+            key, sep, value = line.partition(':')
+            if sep:
+                metadata[key.strip().lower()] = value.strip()
+    return metadata
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _hash_file(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()
+
+
+def _file_digest(path):
+    # Re-stat on every call (cheap) and only re-hash when mtime/size moved
+    signature = _file_signature(path)
+    entry = _digests.get(path)
+    if entry is None or entry[0] != signature:
+        entry = (signature, _hash_file(path))
+        _digests[path] = entry
+    return entry[1]
+
+
+def _cached_table(path):
+    # Only re-parse when the content hash actually changed
+    digest = _file_digest(path)
+    entry = _tables.get(path)
+    if entry is None or entry['digest'] != digest:
+        table, status = parse_statistical_table(path)
+        entry = {'digest': digest, 'table': table, 'status': status}
+        _tables[path] = entry
+    return entry
+
+
+def load_table(name, data_dir=DATA_DIR):
+    """Return the parsed export for a dataset, all territory levels included.
+
+    The frame is shared between sessions and must be treated as read-only.
+    """
+    with _lock:
+        return _cached_table(dataset_path(name, data_dir=data_dir))['table']
+
+
+def load_status(name, data_dir=DATA_DIR):
+    """Status code of every period cell of `load_table(name)`, from the same parse."""
+    with _lock:
+        return _cached_table(dataset_path(name, data_dir=data_dir))['status']
+
+
+def source_digest(name, data_dir=DATA_DIR):
+    """Content hash of a dataset's export, computed without parsing it."""
+    with _lock:
+        return _file_digest(dataset_path(name, data_dir=data_dir))
+
+
+def load_metadata(name, data_dir=DATA_DIR):
+    return read_metadata(dataset_path(name, filename='Metadata.txt', data_dir=data_dir))
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_loader import (DATA_DIR, DATASETS, DEFAULT_LEVELS, DEFAULT_TYPOLOGY, load_metadata,
+                         load_table, parse_period, period_columns, source_digest)
+from validation import validate_exports
+
+# Bump whenever the layout of the tidy table or the header changes so old snapshots are rebuilt
+SCHEMA_VERSION = 4
+
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'indicators.arrow')
+
+TIDY_COLUMNS = ['territory', 'level', 'district', 'indicator', 'date', 'value', 'property_use']
+CATEGORY_COLUMNS = ['territory', 'level', 'district', 'indicator', 'property_use']
+
+# Period-start resampling rules for monthly, quarterly and annual views
+RESAMPLE_RULES = {'M': 'MS', 'Q': 'QS', 'A': 'YS'}
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def tidy_dataset(name, data_dir=DATA_DIR, periods=None):
+    """Turn one wide portaldades export into long (territory, date, value) rows.
+
+    `periods` limits the rows to some of the export's period columns (by label).
+    """
+    table = load_table(name, data_dir=data_dir)
+    periods = period_columns(table) if periods is None else list(periods)
+    dates = pd.DatetimeIndex([parse_period(col) for col in periods])
+    n_rows, n_periods = len(table), len(periods)
+    if 'Property use typology' in table.columns:
+        property_use = np.repeat(table['Property use typology'].to_numpy(), n_periods)
+    else:
+        property_use = np.full(n_rows * n_periods, None, dtype=object)
+    return pd.DataFrame({
+        'territory': np.repeat(table['Territory'].to_numpy(), n_periods),
+        'level': np.repeat(table['Location type'].to_numpy(), n_periods),
+        'district': np.repeat(table['District'].to_numpy(), n_periods),
+        'indicator': name,
+        'date': np.tile(dates.to_numpy(), n_rows),
+        'value': table[periods].to_numpy(dtype=float).ravel(),
+        'property_use': property_use,
+    })
+
+
+def build_table(data_dir=DATA_DIR):
+    tidy = pd.concat([tidy_dataset(name, data_dir=data_dir) for name in DATASETS], ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        tidy[column] = tidy[column].astype('category')
+    return tidy[TIDY_COLUMNS]
+
+
+def current_digests(data_dir=DATA_DIR):
+    return {name: source_digest(name, data_dir=data_dir) for name in DATASETS}
+
+
+class IndicatorStore:
+    """All indicators as one tidy table, plus cached wide views of it.
+
+    `quality` holds the validation report of each export (see validation.py).
+    """
+
+    def __init__(self, table, digests, metadata, quality=None):
+        self.table = table
+        self.digests = digests
+        self.metadata = metadata
+        self.quality = quality or {}
+        self.version = hashlib.sha256(json.dumps(digests, sort_keys=True).encode()).hexdigest()[:16]
+        self._rows = {name: np.flatnonzero(table['indicator'].to_numpy() == name) for name in digests}
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+
+    def rows(self, indicator):
+        return self.table.iloc[self._rows[indicator]]
+
+    def updated(self, indicator, rows, digest, metadata, quality, replace=False):
+        """A new store with `rows` appended to (or, with `replace`, substituted for) one indicator's rows.
+
+        Cached frames of the other indicators carry over; the table is not re-tidied.
+        """
+        rows = rows[TIDY_COLUMNS].copy()
+        for column in CATEGORY_COLUMNS:
+            categories = self.table[column].cat.categories.union(pd.Index(rows[column].dropna().unique()))
+            rows[column] = pd.Categorical(rows[column], categories=categories)
+        table = self.table
+        if replace:
+            table = table.drop(index=table.index[self._rows[indicator]])
+        table = pd.concat([table.astype({column: rows[column].dtype for column in CATEGORY_COLUMNS}), rows],
+                          ignore_index=True)
+        store = IndicatorStore(table, {**self.digests, indicator: digest}, {**self.metadata, indicator: metadata},
+                               {**self.quality, indicator: quality})
+        store.carry_over(self)
+        return store
+
+    def carry_over(self, previous):
+        """Reuse `previous`'s cached frames for every indicator whose source is unchanged."""
+        unchanged = {name for name, digest in self.digests.items() if previous.digests.get(name) == digest}
+        with previous._frames_lock:
+            frames = {key: frame for key, frame in previous._frames.items() if key[1] in unchanged}
+        with self._frames_lock:
+            self._frames.update(frames)
+
+    def wide(self, indicator, levels=DEFAULT_LEVELS, typology=DEFAULT_TYPOLOGY):
+        """Date x Territory frame at the export's native resolution (cached, read-only)."""
+        key = ('wide', indicator, tuple(levels), typology)
+        with self._frames_lock:
+            if key not in self._frames:
+                rows = self.rows(indicator)
+                mask = rows['level'].isin(levels).to_numpy()
+                if rows['property_use'].notna().any():
+                    mask = mask & (rows['property_use'] == typology).to_numpy()
+                rows = rows[mask]
+                wide = rows.pivot(index='date', columns='territory', values='value')
+                wide.columns = wide.columns.astype(str)
+                wide.index.name = 'Date'
+                wide.columns.name = 'Territory'
+                self._frames[key] = wide
+            return self._frames[key]
+
+    def series(self, indicator, levels=DEFAULT_LEVELS, typology=DEFAULT_TYPOLOGY, freq='A', how='first'):
+        """Date x Territory frame resampled to `freq` ('M', 'Q' or 'A').
+
+        Each period is reduced with `how`: 'first' or 'last' available value, or 'mean'.
+        Periods are labelled by their start date.
+        """
+        key = ('series', indicator, tuple(levels), typology, freq, how)
+        wide = self.wide(indicator, levels=levels, typology=typology)
+        with self._frames_lock:
+            if key not in self._frames:
+                self._frames[key] = wide.resample(RESAMPLE_RULES[freq]).agg(how)
+            return self._frames[key]
+
+    def frame(self, indicator, levels=DEFAULT_LEVELS, typology=DEFAULT_TYPOLOGY, aggregation='first'):
+        """Return a Year x Territory frame of floats for the requested levels.
+
+        Sub-annual periods are collapsed per year with `aggregation` ('first', 'last'
+        or 'mean' of the available values). Frames are cached on the store and shared
+        between sessions: treat them as read-only.
+        """
+        key = ('frame', indicator, tuple(levels), typology, aggregation)
+        wide = self.wide(indicator, levels=levels, typology=typology)
+        with self._frames_lock:
+            if key not in self._frames:
+                frame = wide.groupby(wide.index.year).agg(aggregation)
+                frame.index.name = 'Year'
+                self._frames[key] = frame
+            return self._frames[key]
+
+    def territories(self, indicator, levels=DEFAULT_LEVELS):
+        return sorted(self.frame(indicator, levels=levels).columns)
+
+    def territory_table(self):
+        """One row per territory (in export order) with its level and parent district."""
+        columns = ['territory', 'level', 'district']
+        table = self.table[columns].drop_duplicates('territory')
+        return pd.DataFrame({column: table[column].astype(object).to_numpy() for column in columns})
+
+
+def write_snapshot(store, path=SNAPSHOT_PATH):
+    """Persist the tidy table as an uncompressed Arrow IPC file (memory-mappable)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrow_table = pa.Table.from_pandas(store.table, preserve_index=False)
+    header = {'schema_version': SCHEMA_VERSION, 'digests': store.digests, 'metadata': store.metadata,
+              'quality': store.quality}
+    arrow_table = arrow_table.replace_schema_metadata({
+        **(arrow_table.schema.metadata or {}),
+        b'piso_barcelona': json.dumps(header).encode(),
+    })
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    """Memory-map a snapshot; returns (table, header) or None if unusable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, 'r') as source:
+            arrow_table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    header = json.loads((arrow_table.schema.metadata or {}).get(b'piso_barcelona', b'{}'))
+    if header.get('schema_version') != SCHEMA_VERSION:
+        return None
+    return arrow_table.to_pandas(split_blocks=True), header
+
+
+def build_store(data_dir=DATA_DIR, snapshot_path=SNAPSHOT_PATH):
+    """Ingest every export from CSV and refresh the on-disk snapshot."""
+    digests = current_digests(data_dir=data_dir)
+    metadata = {name: load_metadata(name, data_dir=data_dir) for name in DATASETS}
+    store = IndicatorStore(build_table(data_dir=data_dir), digests, metadata, validate_exports(data_dir=data_dir))
+    if snapshot_path:
+        try:
+            write_snapshot(store, snapshot_path)
+        except OSError:
+            # A read-only checkout still works, it just parses the CSVs on startup
+            pass
+    return store
+
+
+def load_store(data_dir=DATA_DIR, snapshot_path=SNAPSHOT_PATH):
+    """Return the process-wide store, loading the snapshot when it matches the CSVs.
+
+    Source files are only hashed (never parsed) to validate the snapshot; an
+    export changed outside refresh.py triggers a rebuild. The store is shared read-only.
+    """
+    key = (data_dir, snapshot_path)
+    with _lock:
+        digests = current_digests(data_dir=data_dir)
+        previous = _stores.get(key)
+        if previous is not None and previous.digests == digests:
+            return previous
+        snapshot = read_snapshot(snapshot_path) if snapshot_path else None
+        if snapshot is not None and snapshot[1].get('digests') == digests:
+            table, header = snapshot
+            store = IndicatorStore(table, digests, header['metadata'], header['quality'])
+        else:
+            store = build_store(data_dir=data_dir, snapshot_path=snapshot_path)
+        if previous is not None:
+            # After a refresh (see refresh.py) only the changed exports lose their frames
+            store.carry_over(previous)
+        _stores[key] = store
+        return store
+
+
+def replace_store(store, data_dir=DATA_DIR, snapshot_path=SNAPSHOT_PATH):
+    """Make `store` the process-wide store for `data_dir` and persist it as the snapshot."""
+    if snapshot_path:
+        write_snapshot(store, snapshot_path)
+    with _lock:
+        _stores[(data_dir, snapshot_path)] = store
+
+
+if __name__ == '__main__':
+    store = build_store()
+    print(f'Wrote {len(store.table)} rows ({store.version}) to {SNAPSHOT_PATH}')
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Memory cap for cached figures, in MB (shared by all sessions of the server process)
+DEFAULT_MAX_MB = float(os.environ.get('FIGURE_CACHE_MAX_MB', 64))
+
+# Stored for inputs without enough data, so the empty state is cached too
+NO_FIGURE = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its entries.
+
+    Sizes are given by the caller on `put`; the least recently used entries are
+    evicted until the total fits `max_bytes` again. Values are shared between
+    threads and sessions and must not be mutated by readers.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+figures = LRUCache(int(DEFAULT_MAX_MB * 1024 * 1024))
+
+
+def figure_size(fig):
+    # The serialised spec is what Streamlit ships, and a good proxy for memory use
+    if fig is None:
+        return sys.getsizeof(NO_FIGURE)
+    return len(fig.to_json())
+
+
+def cached_figure(key, build):
+    """Return the figure for `key`, calling `build()` (which may return None) on a miss.
+
+    Keys should identify the indicator, territory set, relative-change flag, any
+    resampling options and the data version. Figures are shared between sessions.
+    """
+    fig = figures.get(key)
+    if fig is None:
+        fig = build()
+        figures.put(key, NO_FIGURE if fig is None else fig, figure_size(fig))
+        return fig
+    return None if fig is NO_FIGURE else fig
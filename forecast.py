@@ -0,0 +1,106 @@
+import hashlib
+import threading
+
+import numpy as np
+
+# Years of history each trend is fitted on, and the longest projection offered
+WINDOW = 10
+MAX_HORIZON = 10
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom; 1.96 beyond
+T_QUANTILES = np.array([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042])
+
+_lock = threading.Lock()
+_forecasts = {}
+
+
+def t_quantile(dof):
+    dof = np.asarray(dof)
+    return np.where(dof > len(T_QUANTILES), 1.96, T_QUANTILES[np.clip(dof, 1, len(T_QUANTILES)) - 1])
+
+
+class Forecast:
+    """Log-linear trends fitted to every row of a territory x period array at once.
+
+    Each row is fitted by least squares on the log of its last `window` periods
+    ending at its own latest observation, so growth is compounded and the 95%
+    prediction band widens with the horizon. Rows with fewer than three positive
+    observations in the window get no forecast (NaN).
+    """
+
+    def __init__(self, values, time, last, window=WINDOW, max_horizon=MAX_HORIZON):
+        values = np.asarray(values, dtype=float)
+        time = np.asarray(time, dtype=float)
+        last = np.asarray(last)
+        self.last = last
+        self.max_horizon = max_horizon
+
+        # Observations inside each row's window; non-positive values cannot be logged
+        end = time[np.maximum(last, 0)]
+        in_window = (time[None, :] > end[:, None] - window) & (time[None, :] <= end[:, None])
+        used = in_window & (values > 0) & (last >= 0)[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y = np.where(used, np.log(np.where(used, values, 1)), 0.0)
+        weight = used.astype(float)
+
+        n = weight.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_mean = (weight * time).sum(axis=1) / n
+            y_mean = (weight * y).sum(axis=1) / n
+            centred = np.where(used, time[None, :] - t_mean[:, None], 0.0)
+            sxx = (centred ** 2).sum(axis=1)
+            slope = (centred * (y - y_mean[:, None]) * weight).sum(axis=1) / sxx
+            intercept = y_mean - slope * t_mean
+            residuals = np.where(used, y - (intercept[:, None] + slope[:, None] * time[None, :]), 0.0)
+            variance = (residuals ** 2).sum(axis=1) / (n - 2)
+        fitted = (n >= 3) & (sxx > 0)
+
+        self.n = n
+        self.slope = np.where(fitted, slope, np.nan)
+        self.intercept = np.where(fitted, intercept, np.nan)
+        self.variance = np.where(fitted, variance, np.nan)
+        self.t_mean, self.sxx = t_mean, sxx
+        self.end = np.where(fitted, end, np.nan)
+        # Yearly growth implied by the trend, in %
+        self.growth = (np.exp(self.slope) - 1) * 100
+
+        horizons = np.arange(1, max_horizon + 1)
+        self.time = self.end[:, None] + horizons[None, :]
+        log_mean = self.intercept[:, None] + self.slope[:, None] * self.time
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread = np.sqrt(self.variance[:, None] * (1 + 1 / n[:, None]
+                                                       + (self.time - t_mean[:, None]) ** 2 / sxx[:, None]))
+        margin = t_quantile(np.maximum(n - 2, 1).astype(int))[:, None] * spread
+        self.mean = np.exp(log_mean)
+        self.lower = np.exp(log_mean - margin)
+        self.upper = np.exp(log_mean + margin)
+        for array in (self.slope, self.intercept, self.variance, self.growth, self.time, self.mean, self.lower,
+                      self.upper):
+            array.setflags(write=False)
+
+    def row(self, row, horizon=MAX_HORIZON):
+        """(time, mean, lower, upper) for one row over the first `horizon` periods ahead."""
+        horizon = min(horizon, self.max_horizon)
+        return (self.time[row, :horizon], self.mean[row, :horizon], self.lower[row, :horizon],
+                self.upper[row, :horizon])
+
+
+def data_hash(matrix):
+    digest = hashlib.sha256(np.ascontiguousarray(matrix.values).tobytes())
+    digest.update(np.ascontiguousarray(matrix.time).tobytes())
+    return digest.hexdigest()
+
+
+def matrix_forecast(matrix, window=WINDOW):
+    """Cached forecast of an annual IndicatorMatrix, keyed by a hash of its data."""
+    key = (matrix.name, data_hash(matrix), window)
+    with _lock:
+        forecast = _forecasts.get(key)
+    if forecast is None:
+        forecast = Forecast(matrix.values, matrix.time, matrix.last, window=window)
+        with _lock:
+            for stale in [cached for cached in _forecasts if cached[0] == matrix.name and cached[2] == window]:
+                del _forecasts[stale]
+            _forecasts[key] = forecast
+    return forecast
@@ -0,0 +1,343 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from affordability import affordability_matrix
+from data_loader import ALL_LEVELS, DEFAULT_TYPOLOGY
+from indicators import INDICATORS
+
+# Property use selections whose summed matrix each TypologyCube keeps
+MAX_SELECTIONS = 32
+
+_lock = threading.Lock()
+_matrices = {}
+_typology_cubes = {}
+_cubes = {}
+
+
+# Function to calculate CAGR (works on scalars and arrays alike)
+def calculate_cagr(start_value, end_value, periods):
+    start_value, end_value, periods = np.broadcast_arrays(
+        np.asarray(start_value, dtype=float), np.asarray(end_value, dtype=float),
+        np.asarray(periods, dtype=float))
+    valid = (periods != 0) & ~np.isnan(start_value) & ~np.isnan(end_value) & (start_value != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = ((end_value / start_value) ** (1 / periods) - 1) * 100
+    cagr = np.where(valid, cagr, np.nan)
+    return cagr[()] if cagr.ndim == 0 else cagr
+
+
+def prefix_sums(values):
+    """Running sums and counts of the observed values per row, with a leading zero column."""
+    observed = ~np.isnan(values)
+    sums = np.zeros((values.shape[0], values.shape[1] + 1))
+    counts = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.where(observed, values, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(observed, axis=1, out=counts[:, 1:])
+    return sums, counts
+
+
+def relative_change(values):
+    # Row-wise pct_change * 100; a missing or zero base gives NaN rather than inf
+    relative = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative[:, 1:] = (values[:, 1:] / values[:, :-1] - 1) * 100
+    relative[~np.isfinite(relative)] = np.nan
+    return relative
+
+
+class IndicatorMatrix:
+    """One indicator as a territory x year array with everything panels need precomputed."""
+
+    def __init__(self, name, territories, dates, values, freq='A', bounds=None):
+        self.name = name
+        self.freq = freq
+        self.territories = list(territories)
+        self.index = {territory: row for row, territory in enumerate(self.territories)}
+        self.dates = pd.DatetimeIndex(dates)
+        self.years = self.dates.year.to_numpy()
+        # Fractional years, so CAGR periods stay exact for annual and monthly data alike
+        self.time = self.years + (self.dates.month.to_numpy() - 1) / 12
+        # What panels put on the x axis
+        self.x_label = 'Year' if freq == 'A' else 'Date'
+        self.x = self.years if freq == 'A' else self.dates
+        values = np.array(values, dtype=float)
+        values[~np.isfinite(values)] = np.nan
+        self.values = values
+        self.relative = relative_change(values)
+
+        # First and last observed period per territory, -1 when the row is empty
+        valid = ~np.isnan(values)
+        has_data = valid.any(axis=1)
+        self.first = np.where(has_data, valid.argmax(axis=1), -1)
+        self.last = np.where(has_data, values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1), -1)
+        self.cagr = self.cagr_between(np.arange(len(self.territories)), self.first, self.last)
+
+        # For constant-time window queries: the nearest observed period at or after and at
+        # or before every position (-1 when none), and running sums of the values and of
+        # the period-on-period changes, so window averages are two lookups
+        positions = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        after = np.minimum.accumulate(np.where(valid, positions, values.shape[1])[:, ::-1], axis=1)[:, ::-1]
+        self.next_valid = np.where(after < values.shape[1], after, -1)
+        self.prev_valid = np.maximum.accumulate(np.where(valid, positions, -1), axis=1)
+        self.value_sums, self.value_counts = prefix_sums(values)
+        self.change_sums, self.change_counts = prefix_sums(self.relative)
+        # Values outside the indicator's sanity bounds, flagged once for every territory
+        if bounds is None:
+            self.out_of_range = np.zeros(values.shape, dtype=bool)
+        else:
+            self.out_of_range = (values < bounds[0]) | (values > bounds[1])
+
+        for array in (self.values, self.relative, self.first, self.last, self.cagr, self.next_valid, self.prev_valid,
+                      self.value_sums, self.value_counts, self.change_sums, self.change_counts, self.out_of_range):
+            array.setflags(write=False)
+
+    def __contains__(self, territory):
+        return territory in self.index
+
+    def series(self, territory, relative=False):
+        """Values for one territory aligned with self.dates (read-only view)."""
+        return (self.relative if relative else self.values)[self.index[territory]]
+
+    def cagr_between(self, rows, start, end):
+        """CAGR of the given rows between two period positions (vectorized)."""
+        rows, start, end = np.broadcast_arrays(np.asarray(rows), np.asarray(start), np.asarray(end))
+        empty = (start < 0) | (end < 0)
+        start, end = np.where(empty, 0, start), np.where(empty, 0, end)
+        periods = self.time[end] - self.time[start]
+        return calculate_cagr(self.values[rows, start], self.values[rows, end], periods)
+
+    def window(self, start_year=None, end_year=None):
+        """Period positions (lo, hi) covering the years start_year..end_year; None for all of them."""
+        if start_year is None and end_year is None:
+            return None
+        lo = np.searchsorted(self.years, start_year, side='left') if start_year is not None else 0
+        hi = np.searchsorted(self.years, end_year, side='right') - 1 if end_year is not None else len(self.years) - 1
+        return int(lo), int(hi)
+
+    def span(self, rows, window=None):
+        """First and last observed positions of the rows within a window, -1 when there are none."""
+        if window is None:
+            return self.first[rows], self.last[rows]
+        lo, hi = window
+        if lo > hi:
+            empty = np.full(np.shape(rows), -1)
+            return empty, empty
+        first, last = self.next_valid[rows, lo], self.prev_valid[rows, hi]
+        inside = (first >= 0) & (first <= hi) & (last >= lo)
+        return np.where(inside, first, -1), np.where(inside, last, -1)
+
+    def window_stats(self, rows, window=None):
+        """CAGR, total change and average period-on-period growth (all in %) and the average
+        value of the rows within a window, each from a few array lookups."""
+        rows = np.asarray(rows)
+        first, last = self.span(rows, window)
+        empty = first < 0
+        first, last = np.where(empty, 0, first), np.where(empty, 0, last)
+        lo, hi = window if window is not None else (0, len(self.years) - 1)
+        start, end = self.values[rows, first], self.values[rows, last]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = (end / start - 1) * 100
+            # Changes from the first observation onwards, so the window start itself is not a change
+            growth = ((self.change_sums[rows, last + 1] - self.change_sums[rows, first + 1])
+                      / (self.change_counts[rows, last + 1] - self.change_counts[rows, first + 1]))
+            average = ((self.value_sums[rows, hi + 1] - self.value_sums[rows, lo])
+                       / (self.value_counts[rows, hi + 1] - self.value_counts[rows, lo]))
+        stats = {
+            'cagr': self.cagr_between(rows, np.where(empty, -1, first), np.where(empty, -1, last)),
+            'change': change,
+            'growth': growth,
+            'average': average,
+        }
+        return {name: np.where(empty | ~np.isfinite(values), np.nan, values) for name, values in stats.items()}
+
+    def territory_cagr(self, territory, window_of=None, window=None):
+        """CAGR of a territory, optionally over the observed span of another one, within a window of periods."""
+        row = self.index[territory]
+        if window_of is None and window is None:
+            return float(self.cagr[row])
+        first, last = self.span(self.index[window_of or territory], window)
+        return float(self.cagr_between(row, first, last))
+
+    def latest(self, territory, window=None):
+        """The territory's last observed value (within a window), NaN when there is none."""
+        row = self.index[territory]
+        last = self.span(row, window)[1]
+        return float(self.values[row, last]) if last >= 0 else np.nan
+
+
+def build_matrix(store, spec, freq='A', how=None):
+    frame = spec.load(store, ALL_LEVELS, spec, freq=freq, how=how)
+    return IndicatorMatrix(spec.key, frame.columns, frame.index, frame.to_numpy(dtype=float).T, freq=freq,
+                           bounds=spec.bounds)
+
+
+def indicator_matrix(store, name, freq='A', how=None):
+    """Cached matrix for one indicator; rebuilt only when one of its sources changes.
+
+    Indicators that only exist annually ignore `freq` and return the annual matrix.
+    """
+    spec = INDICATORS[name]
+    freq = freq if freq in spec.resolutions else 'A'
+    how = how or spec.aggregation
+    digests = tuple(store.digests[source] for source in spec.sources)
+    key = (name, freq, how, digests)
+    with _lock:
+        if key not in _matrices:
+            for stale in [cached for cached in _matrices if cached[0] == name and cached[3] != digests]:
+                del _matrices[stale]
+            _matrices[key] = build_matrix(store, spec, freq, how)
+        return _matrices[key]
+
+
+class TypologyCube:
+    """One indicator as a territory x property use x period array, for breakdowns by typology."""
+
+    def __init__(self, name, territories, typologies, dates, values):
+        self.name = name
+        self.territories = list(territories)
+        self.index = {territory: row for row, territory in enumerate(self.territories)}
+        self.typologies = list(typologies)
+        self.typology_index = {typology: position for position, typology in enumerate(self.typologies)}
+        self.dates = pd.DatetimeIndex(dates)
+        self.years = self.dates.year.to_numpy()
+        self.values = np.array(values, dtype=float)
+        self.values.setflags(write=False)
+        # Least recently used selection first
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, territory):
+        return territory in self.index
+
+    def positions(self, typologies=None):
+        if typologies is None:
+            return np.arange(len(self.typologies))
+        return np.array([self.typology_index[typology] for typology in typologies
+                         if typology in self.typology_index], dtype=int)
+
+    def totals(self, typologies=None):
+        """Territory x period sums over the given typologies; NaN where none of them is reported."""
+        values = self.values[:, self.positions(typologies)]
+        observed = ~np.isnan(values).all(axis=1)
+        return np.where(observed, np.nansum(values, axis=1), np.nan)
+
+    def matrix(self, typologies=None):
+        """IndicatorMatrix of the summed typologies, cached for the MAX_SELECTIONS latest selections."""
+        key = tuple(self.typologies if typologies is None else typologies)
+        with self._lock:
+            if key in self._matrices:
+                self._matrices.move_to_end(key)
+            else:
+                self._matrices[key] = IndicatorMatrix(self.name, self.territories, self.dates, self.totals(key))
+                if len(self._matrices) > MAX_SELECTIONS:
+                    self._matrices.popitem(last=False)
+            return self._matrices[key]
+
+    def breakdown(self, territory, typologies=None):
+        """Typology x period values for one territory."""
+        return self.values[self.index[territory]][self.positions(typologies)]
+
+    def latest_breakdown(self, territories, typologies=None, years=None):
+        """Per-typology values in each territory's latest reported period, within the
+        (start, end) year range `years` if given.
+
+        Returns the territories that have data, their latest year and a
+        territory x typology array.
+        """
+        territories = [territory for territory in territories if territory in self.index]
+        rows = np.array([self.index[territory] for territory in territories], dtype=int)
+        matrix = self.matrix(typologies)
+        last = matrix.span(rows, matrix.window(*years) if years else None)[1]
+        observed = last >= 0
+        rows, last = rows[observed], last[observed]
+        values = self.values[rows[:, None], self.positions(typologies)[None, :], last[:, None]]
+        return [territory for territory, keep in zip(territories, observed) if keep], self.years[last], values
+
+
+def build_typology_cube(store, name):
+    # Scatter the tidy rows straight into the 3-d array; territories and typologies keep export order
+    rows = store.rows(name)
+    rows = rows[rows['level'].isin(ALL_LEVELS).to_numpy()]
+    territory_codes, territories = pd.factorize(rows['territory'].astype(object))
+    typology_codes, typologies = pd.factorize(rows['property_use'].astype(object))
+    dates, date_codes = np.unique(rows['date'].to_numpy(), return_inverse=True)
+    values = np.full((len(territories), len(typologies), len(dates)), np.nan)
+    values[territory_codes, typology_codes, date_codes] = rows['value'].to_numpy(dtype=float)
+    return TypologyCube(name, territories, typologies, dates, values)
+
+
+def typology_cube(store, name):
+    """Cached typology cube for an indicator whose exports are split by property use."""
+    digests = tuple(store.digests[source] for source in INDICATORS[name].sources)
+    key = (name, digests)
+    with _lock:
+        if key not in _typology_cubes:
+            for stale in [cached for cached in _typology_cubes if cached[0] == name]:
+                del _typology_cubes[stale]
+            _typology_cubes[key] = build_typology_cube(store, name)
+        return _typology_cubes[key]
+
+
+def source_version(store, spec):
+    digests = '/'.join(store.digests[source] for source in spec.sources)
+    return hashlib.sha256(digests.encode()).hexdigest()[:16]
+
+
+class IndicatorCube:
+    """Every dashboard indicator for every territory, keyed for O(1) lookups."""
+
+    def __init__(self, store):
+        self.store = store
+        self.version = store.version
+        # Per-indicator versions, so a refreshed export only invalidates what is built from it
+        self.versions = {name: source_version(store, spec) for name, spec in INDICATORS.items()}
+        self.matrices = {name: indicator_matrix(store, name) for name in INDICATORS}
+        # First and last year of any indicator, the bounds of the year range filter
+        years = np.concatenate([matrix.years for matrix in self.matrices.values()])
+        self.years = (int(years.min()), int(years.max()))
+        # All datasets joined on one territory x year grid, for the affordability view
+        self.affordability = affordability_matrix(store)
+        territories = store.territory_table()
+        territories = territories[territories['level'].isin(ALL_LEVELS)]
+        self.levels = dict(zip(territories['territory'], territories['level']))
+        self.districts = {territory: district if isinstance(district, str) else None
+                          for territory, district in zip(territories['territory'], territories['district'])}
+
+    def __getitem__(self, name):
+        return self.matrices[name]
+
+    def matrix(self, name, freq='A', how=None, typologies=None):
+        """Matrix at another resolution, aggregation or property use selection, built on first use and cached.
+
+        `typologies` only applies to indicators split by property use (which are
+        annual); their matrix is then the sum over the selected typologies.
+        """
+        spec = INDICATORS[name]
+        if spec.by_typology and typologies and tuple(typologies) != (DEFAULT_TYPOLOGY,):
+            return self.typology(name).matrix(typologies)
+        if freq == 'A' and how in (None, spec.aggregation):
+            return self.matrices[name]
+        return indicator_matrix(self.store, name, freq, how)
+
+    def typology(self, name):
+        return typology_cube(self.store, name)
+
+    def territories(self, levels=ALL_LEVELS, district=None):
+        """Territories at the given levels in export order, optionally within one district."""
+        return [territory for territory, level in self.levels.items()
+                if level in levels and (district is None or self.districts[territory] == district)]
+
+
+def load_cube(store):
+    with _lock:
+        cube = _cubes.get(store.version)
+    if cube is None:
+        cube = IndicatorCube(store)
+        with _lock:
+            _cubes.clear()
+            _cubes[store.version] = cube
+    return cube
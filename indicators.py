@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+
+from data_loader import DEFAULT_TYPOLOGY
+from yields import yield_matrix
+
+NO_DATA_MESSAGE = 'No data available for the selected district and year range.'
+
+
+@dataclass(frozen=True)
+class IndicatorSpec:
+    """Everything needed to compute and render one dashboard indicator.
+
+    `load(store, levels, spec)` returns a Year x Territory frame; `sources` are the
+    store datasets it reads, used to invalidate cached results when they change.
+    """
+    key: str
+    subheader: str
+    title: str
+    y_axis_title: str
+    sources: tuple
+    load: object
+    aggregation: str = 'first'
+    bounds: tuple = None
+    empty_message: str = NO_DATA_MESSAGE
+    # Values are already percentages (yields), so a growth rate of them is not meaningful
+    is_rate: bool = False
+    # Resolutions the source data supports ('M', 'Q', 'A'); annual-only by default
+    resolutions: tuple = ('A',)
+    # Source rows are split by property use typology, so panels can sum any subset of them
+    by_typology: bool = False
+
+
+def load_dataset(store, levels, spec, freq='A', how=None):
+    return store.series(spec.sources[0], levels=levels, typology=DEFAULT_TYPOLOGY,
+                        freq=freq, how=how or spec.aggregation)
+
+
+def load_roi(store, levels, spec, freq='A', how=None):
+    # Gross yield: a year of rent over the purchase price, both per m²
+    return yield_matrix(store, levels=levels, freq=freq, how=how or spec.aggregation).frame('gross')
+
+
+def load_net_yield(store, levels, spec, freq='A', how=None):
+    # After vacancy, running costs and purchase taxes, with the default YieldAssumptions
+    return yield_matrix(store, levels=levels, freq=freq, how=how or spec.aggregation).frame('net')
+
+
+# Panels in display order, filled into a grid three per row
+PANELS = [
+    IndicatorSpec('population', 'Population Development', 'Population', 'Population',
+                  sources=('population',), load=load_dataset, resolutions=('M', 'Q', 'A')),
+    IndicatorSpec('unemployment', 'Unemployment Development', 'Unemployment', 'Number of Unemployed Persons',
+                  sources=('unemployment',), load=load_dataset, resolutions=('M', 'Q', 'A')),
+    IndicatorSpec('income', 'Income Development', 'Income', 'Mean Gross Income (€)',
+                  sources=('income',), load=load_dataset),
+    IndicatorSpec('transactions', 'Transactions Volume', 'Transactions', 'Number of Transactions',
+                  sources=('transactions',), load=load_dataset, by_typology=True),
+    IndicatorSpec('transaction_price', 'Transaction Price Analysis (€/m²)', 'Transaction Price',
+                  'Avg. Transaction Price (€/m²)', sources=('transaction_price',), load=load_dataset,
+                  bounds=(500, 20000),
+                  empty_message='No transaction price data available for the selected district.'),
+    IndicatorSpec('rental_price', 'Rental Price Analysis (€/m²)', 'Rental Price', 'Avg. Monthly Rent (€/m²)',
+                  sources=('rental_price',), load=load_dataset, bounds=(2, 60),
+                  empty_message='No rental price data available for the selected district.'),
+    IndicatorSpec('roi', 'Return on Investment (ROI)', 'ROI', 'ROI (%)',
+                  sources=('rental_price', 'transaction_price'), load=load_roi, is_rate=True,
+                  empty_message='No ROI data available for the selected district.'),
+    IndicatorSpec('net_yield', 'Net Rental Yield', 'Net Yield', 'Net Yield (%)',
+                  sources=('rental_price', 'transaction_price'), load=load_net_yield, is_rate=True,
+                  empty_message='No yield data available for the selected district.'),
+]
+
+INDICATORS = {spec.key: spec for spec in PANELS}
+
+RESOLUTIONS = {'A': 'Annual', 'Q': 'Quarterly', 'M': 'Monthly'}
+AGGREGATIONS = {'first': 'First of period', 'mean': 'Period mean', 'last': 'End of period'}
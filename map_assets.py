@@ -0,0 +1,84 @@
+import glob
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+from data_loader import DATA_DIR
+
+MAP_SOURCE = os.path.join(DATA_DIR, 'bcn_map.png')
+ASSET_DIR = os.path.join(DATA_DIR, '.cache', 'assets')
+
+# Pixel widths to render; the sidebar is ~340 CSS px wide, so 680 covers 2x screens
+VARIANT_WIDTHS = (340, 680, 1020)
+DEFAULT_WIDTH = 680
+WEBP_QUALITY = 80
+
+_lock = threading.Lock()
+_variants = {}
+
+
+def content_hash(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()[:16]
+
+
+def variant_path(source, digest, width, asset_dir=ASSET_DIR):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(asset_dir, f'{stem}.{digest}.{width}.webp')
+
+
+def build_variants(source=MAP_SOURCE, widths=VARIANT_WIDTHS, asset_dir=ASSET_DIR):
+    """Write resized WebP copies of `source` named by its content hash; returns {width: path}.
+
+    Existing variants for the same content are reused, and variants of older
+    versions of the image are removed. Widths above the original are skipped.
+    """
+    digest = content_hash(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    os.makedirs(asset_dir, exist_ok=True)
+    variants = {}
+    with Image.open(source) as image:
+        for width in sorted(widths):
+            if width > image.width:
+                continue
+            path = variant_path(source, digest, width, asset_dir)
+            if not os.path.exists(path):
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                resized.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=6)
+                os.replace(tmp_path, path)
+            variants[width] = path
+    for stale in glob.glob(os.path.join(asset_dir, f'{stem}.*.webp')):
+        if stale not in variants.values():
+            os.remove(stale)
+    return variants
+
+
+def map_variants(source=MAP_SOURCE, asset_dir=ASSET_DIR):
+    """Variants of the map for this process, built on first use (or by `python map_assets.py`)."""
+    key = (source, asset_dir)
+    with _lock:
+        if key not in _variants:
+            try:
+                _variants[key] = build_variants(source, asset_dir=asset_dir)
+            except OSError:
+                # Read-only checkout: fall back to the original image
+                _variants[key] = {}
+        return _variants[key]
+
+
+def map_image(width=DEFAULT_WIDTH, source=MAP_SOURCE):
+    """Path of the smallest variant at least `width` pixels wide (the largest otherwise)."""
+    variants = map_variants(source)
+    if not variants:
+        return source
+    adequate = [candidate for candidate in sorted(variants) if candidate >= width]
+    return variants[adequate[0] if adequate else max(variants)]
+
+
+if __name__ == '__main__':
+    for width, path in build_variants().items():
+        print(f'{width:>5}px  {os.path.getsize(path) / 1024:8.1f} KiB  {path}')
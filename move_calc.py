@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+COUNTRIES = ('ch', 'es')
+COUNTRY_NAMES = {'ch': 'Schweiz', 'es': 'Spanien'}
+
+# Calculator inputs in sidebar order, with their German labels
+PARAMETERS = {
+    'brutto': 'Bruttojahreseinkommen',
+    'steuersatz_ch': 'Steuersatz Schweiz (%)',
+    'steuersatz_es': 'Steuersatz Spanien (%)',
+    'soz_ch': 'Sozialversicherungsbeiträge Schweiz (%)',
+    'soz_es': 'Sozialversicherungsbeiträge Spanien (%)',
+    'kk_ch': 'Monatl. Krankenkasse Schweiz',
+    'kk_es': 'Monatl. Krankenkasse Spanien',
+    'miete_ch': 'Monatl. Miete Schweiz',
+    'miete_es': 'Monatl. Miete Spanien',
+    'leb_ch': 'Jährl. Lebenshaltungskosten Schweiz',
+    'leb_es': 'Jährl. Lebenshaltungskosten Spanien',
+}
+
+# Slider bounds of the percentage inputs; amounts are swept from 0 to twice their value
+RATE_BOUNDS = {
+    'steuersatz_ch': (0.0, 50.0),
+    'steuersatz_es': (0.0, 50.0),
+    'soz_ch': (0.0, 20.0),
+    'soz_es': (0.0, 20.0),
+}
+
+# Points along y searched for the break-even when tax brackets make the metrics non-linear
+BREAK_EVEN_POINTS = 200
+
+METRICS = {
+    'netto': 'Nettoeinkommen',
+    'sparpotenzial': 'Sparpotenzial',
+    'gesamtkosten': 'Gesamtkosten',
+}
+
+
+def country_result(brutto, steuersatz, soz, kk, miete, leb, tax=None):
+    """Yearly Netto, Gesamtkosten and Sparpotenzial for one country.
+
+    Monthly inputs (Krankenkasse, Miete) are annualised. Works on scalars and
+    on any arrays that broadcast together. With a `tax` callable (see
+    tax_brackets) income tax comes from its brackets, levied on gross income
+    less social contributions, and `steuersatz` is ignored.
+    """
+    sozial = brutto * (soz / 100.0)
+    if tax is None:
+        steuern = brutto * (steuersatz / 100.0)
+    else:
+        steuern = tax(brutto - sozial)
+    kk_jahr = kk * 12
+    miete_jahr = miete * 12
+    netto = brutto - steuern - sozial - kk_jahr
+    return {
+        'netto': netto,
+        'gesamtkosten': steuern + sozial + kk_jahr + miete_jahr + leb,
+        'sparpotenzial': netto - (miete_jahr + leb),
+    }
+
+
+def evaluate(params, taxes=None):
+    """All metrics for both countries plus the CH minus ES differences, in one broadcast pass.
+
+    `params` maps every name in PARAMETERS to a scalar or an array; the results
+    have the broadcast shape of the inputs. `taxes` optionally maps a country to
+    its progressive tax callable, replacing the flat Steuersatz.
+    """
+    taxes = taxes or {}
+    params = {name: np.asarray(params[name], dtype=float) for name in PARAMETERS}
+    results = {}
+    for country in COUNTRIES:
+        country_metrics = country_result(params['brutto'], params[f'steuersatz_{country}'], params[f'soz_{country}'],
+                                         params[f'kk_{country}'], params[f'miete_{country}'],
+                                         params[f'leb_{country}'], tax=taxes.get(country))
+        results.update({f'{metric}_{country}': value for metric, value in country_metrics.items()})
+    for metric in METRICS:
+        results[f'{metric}_diff'] = results[f'{metric}_ch'] - results[f'{metric}_es']
+    return results
+
+
+def recommendation(difference):
+    # Ties go to Spanien, as in the original single-scenario comparison
+    return np.where(np.asarray(difference) > 0, COUNTRY_NAMES['ch'], COUNTRY_NAMES['es'])
+
+
+def sweep_parameters(taxes=None):
+    """Parameters that affect the result; flat tax rates drop out once brackets are used."""
+    taxes = taxes or {}
+    return [name for name in PARAMETERS
+            if not (name.startswith('steuersatz_') and name.rsplit('_', 1)[1] in taxes)]
+
+
+def sweep_range(name, base):
+    """Default (low, high) range to sweep a parameter over."""
+    if name in RATE_BOUNDS:
+        return RATE_BOUNDS[name]
+    return 0.0, max(2 * float(base), 1.0)
+
+
+def grid(base, x_name, x_values, y_name, y_values, taxes=None):
+    """Evaluate every (x, y) combination at once; results are len(y) x len(x) arrays."""
+    if x_name == y_name:
+        raise ValueError('x and y must be different parameters')
+    params = dict(base)
+    params[x_name] = np.asarray(x_values, dtype=float)[None, :]
+    params[y_name] = np.asarray(y_values, dtype=float)[:, None]
+    return evaluate(params, taxes)
+
+
+def break_even(base, x_name, x_values, y_name, metric='sparpotenzial', taxes=None, y_values=None):
+    """Value of `y_name` at which Schweiz and Spanien tie on `metric`, for each x.
+
+    With flat tax rates every metric is linear in each single parameter, so two
+    evaluations per x (y = 0 and y = 1) pin the line down exactly. With tax
+    brackets the first sign change along `y_values` is interpolated instead
+    (BREAK_EVEN_POINTS over the parameter's sweep_range by default).
+    NaN where there is no crossing.
+    """
+    x_values = np.asarray(x_values, dtype=float)
+    if taxes:
+        if y_values is None:
+            y_values = np.linspace(*sweep_range(y_name, base[y_name]), BREAK_EVEN_POINTS)
+        difference = grid(base, x_name, x_values, y_name, y_values, taxes)[f'{metric}_diff']
+        return grid_crossing(np.broadcast_to(difference, (len(y_values), len(x_values))), y_values)
+    params = dict(base)
+    params[x_name] = x_values[:, None]
+    params[y_name] = np.array([0.0, 1.0])[None, :]
+    difference = evaluate(params)[f'{metric}_diff']
+    difference = np.broadcast_to(difference, (len(x_values), 2))
+    slope = difference[:, 1] - difference[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = -difference[:, 0] / slope
+    return np.where(slope != 0, crossing, np.nan)
+
+
+def grid_crossing(difference, y_values):
+    # First sign change down each column of a len(y) x len(x) grid, linearly interpolated
+    y_values = np.asarray(y_values, dtype=float)
+    difference = np.atleast_2d(difference)
+    flips = np.sign(difference[:-1]) != np.sign(difference[1:])
+    has_flip = flips.any(axis=0)
+    row = flips.argmax(axis=0)
+    columns = np.arange(difference.shape[1])
+    below, above = difference[row, columns], difference[row + 1, columns]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = below / (below - above)
+    crossing = y_values[row] + fraction * (y_values[row + 1] - y_values[row])
+    return np.where(has_flip, crossing, np.nan)
+
+
+def tornado(base, spread=0.2, metric='sparpotenzial_diff', taxes=None):
+    """Sensitivity of `metric` to moving each parameter by +/- `spread` of its value.
+
+    All 2 x len(parameters) variants are evaluated in one pass. Returns one row
+    per parameter, sorted by the width of its swing (widest first).
+    """
+    names = sweep_parameters(taxes)
+    n = len(names)
+    params = {name: np.full(2 * n, float(base[name])) for name in PARAMETERS}
+    for position, name in enumerate(names):
+        low, high = float(base[name]) * (1 - spread), float(base[name]) * (1 + spread)
+        if name in RATE_BOUNDS:
+            low, high = np.clip([low, high], *RATE_BOUNDS[name])
+        params[name][position] = low
+        params[name][n + position] = high
+    values = evaluate(params, taxes)[metric]
+    baseline = float(evaluate(base, taxes)[metric])
+    table = pd.DataFrame({
+        'parameter': [PARAMETERS[name] for name in names],
+        'low': values[:n] - baseline,
+        'high': values[n:] - baseline,
+    })
+    table['swing'] = (table['high'] - table['low']).abs()
+    return table.sort_values('swing', ascending=False, ignore_index=True), baseline
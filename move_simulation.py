@@ -0,0 +1,91 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from move_calc import COUNTRIES, METRICS, evaluate
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    """Distributions of the yearly changes drawn for each scenario.
+
+    Rents, living costs and the CHF/EUR rate follow independent geometric random
+    walks: every year their log changes are drawn from a normal distribution with
+    the given drift and volatility (both in % per year). The entered inputs are
+    the values for year 0.
+    """
+    scenarios: int = 20000
+    years: int = 5
+    seed: int = 42
+    rent_ch_drift: float = 1.5
+    rent_ch_volatility: float = 3.0
+    rent_es_drift: float = 3.0
+    rent_es_volatility: float = 6.0
+    living_drift: float = 2.0
+    living_volatility: float = 1.5
+    # Volatility of the CHF to EUR rate; Swiss results are converted at the simulated rate
+    fx_volatility: float = 5.0
+
+
+def fit_rent_growth(store, territory='Barcelona', since=None):
+    """Drift and volatility (% per year) of log rent changes from the rental price history."""
+    series = store.series('rental_price', levels=('Municipi', 'Districte', 'Barri'), freq='A', how='mean')
+    if territory not in series.columns:
+        raise KeyError(f'No rental price history for {territory}')
+    rents = series[territory].dropna()
+    if since is not None:
+        rents = rents[rents.index.year >= since]
+    changes = np.diff(np.log(rents.to_numpy()))
+    if len(changes) < 2:
+        raise ValueError(f'Not enough rental price history for {territory}')
+    return float(changes.mean() * 100), float(changes.std(ddof=1) * 100)
+
+
+def with_fitted_rent(config, store, territory='Barcelona', since=None):
+    drift, volatility = fit_rent_growth(store, territory, since)
+    return replace(config, rent_es_drift=drift, rent_es_volatility=volatility)
+
+
+def random_walk(rng, drift, volatility, shape):
+    # Cumulative growth factors, one column per simulated year
+    steps = rng.normal(drift / 100, volatility / 100, size=shape)
+    return np.exp(np.cumsum(steps, axis=1))
+
+
+def simulate(base, config=SimulationConfig(), taxes=None):
+    """Draw `config.scenarios` paths over `config.years` years and evaluate them in one pass.
+
+    Returns the evaluate() results as scenarios x years arrays, with the Swiss
+    metrics converted to EUR at the simulated exchange rate relative to today's.
+    The same seed always gives the same draws.
+    """
+    rng = np.random.default_rng(config.seed)
+    shape = (config.scenarios, config.years)
+    params = {name: np.asarray(value, dtype=float) for name, value in base.items()}
+    params['miete_ch'] = params['miete_ch'] * random_walk(rng, config.rent_ch_drift, config.rent_ch_volatility, shape)
+    params['miete_es'] = params['miete_es'] * random_walk(rng, config.rent_es_drift, config.rent_es_volatility, shape)
+    for country in COUNTRIES:
+        params[f'leb_{country}'] = params[f'leb_{country}'] * random_walk(rng, config.living_drift,
+                                                                          config.living_volatility, shape)
+    fx = random_walk(rng, 0.0, config.fx_volatility, shape)
+
+    results = evaluate(params, taxes)
+    for metric in METRICS:
+        results[f'{metric}_ch'] = results[f'{metric}_ch'] * fx
+        results[f'{metric}_diff'] = results[f'{metric}_ch'] - results[f'{metric}_es']
+    return results
+
+
+def percentile_bands(values, percentiles=PERCENTILES):
+    """Year x percentile table of a scenarios x years array."""
+    bands = np.percentile(values, percentiles, axis=0).T
+    return pd.DataFrame(bands, index=pd.RangeIndex(1, values.shape[1] + 1, name='Jahr'),
+                        columns=[f'P{percentile}' for percentile in percentiles])
+
+
+def probability_es_better(results, metric='sparpotenzial'):
+    """Share of scenarios per year in which Spanien beats Schweiz on `metric`."""
+    return (results[f'{metric}_diff'] < 0).mean(axis=0)
@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import profiling
+from affordability import LABELS
+from figure_cache import cached_figure
+from forecast import matrix_forecast
+
+REFERENCE_TERRITORY = 'Barcelona'
+
+
+def panel_territories(territory):
+    # The selected territory is always compared against Barcelona
+    return list(dict.fromkeys([territory, REFERENCE_TERRITORY]))
+
+
+def panel_frame(matrix, territories, relative=False, window=None):
+    """Year (or Date) column plus one column per territory, limited to periods where all have data.
+
+    `window` is a (lo, hi) pair of period positions, as returned by matrix.window().
+    """
+    rows = [matrix.index[territory] for territory in territories]
+    columns = slice(window[0], window[1] + 1) if window is not None else slice(None)
+    values = (matrix.relative if relative else matrix.values)[rows, columns]
+    frame = pd.DataFrame(values.T, columns=territories)
+    frame.insert(0, matrix.x_label, matrix.x[columns])
+    return frame.dropna()
+
+
+def out_of_bounds(matrix, territories, window=None):
+    """True if any jointly observed value (within the window's periods, if given) falls outside the
+    indicator's sanity bounds (precomputed mask)."""
+    rows = [matrix.index[territory] for territory in territories]
+    lo, hi = window if window is not None else (0, len(matrix.dates) - 1)
+    jointly_observed = ~np.isnan(matrix.values[rows, lo:hi + 1]).any(axis=0)
+    return bool(matrix.out_of_range[rows, lo:hi + 1][:, jointly_observed].any())
+
+
+def cagr_text(matrix, territory, relative=False, window=None):
+    if relative:
+        cagr = cagr_bcn = np.nan
+    else:
+        cagr = matrix.territory_cagr(territory, window=window)
+        cagr_bcn = matrix.territory_cagr(REFERENCE_TERRITORY, window_of=territory, window=window)
+    text = f'CAGR: {cagr:.2f}%'
+    if window is not None and not relative:
+        # Total change over the window as well, from the same precomputed lookups
+        change = matrix.window_stats(matrix.index[territory], window)['change']
+        text += f', total change: {change:.1f}%'
+    if territory == REFERENCE_TERRITORY:
+        return text
+    return f'{text} vs Barcelona: {cagr_bcn:.2f}%'
+
+
+def rate_text(matrix, territory, window=None):
+    # Yields are already percentages: show their level, since a growth rate of them means little
+    average = matrix.window_stats(matrix.index[territory], window)['average']
+    text = f'Latest: {matrix.latest(territory, window):.2f}%, average: {average:.2f}%'
+    if territory == REFERENCE_TERRITORY:
+        return text
+    return f'{text} vs Barcelona: {matrix.latest(REFERENCE_TERRITORY, window):.2f}%'
+
+
+def add_forecast(fig, matrix, territories, horizon, bands=True):
+    """Dashed trend projections (and 95% bands) after each territory's line, in the line's colour."""
+    forecast = matrix_forecast(matrix)
+    # px.line draws one trace per territory, in order
+    for territory, trace in zip(territories, list(fig.data)):
+        years, mean, lower, upper = forecast.row(matrix.index[territory], horizon)
+        if np.isnan(mean).all():
+            continue
+        colour = trace.line.color
+        if bands:
+            fig.add_scatter(x=np.concatenate([years, years[::-1]]), y=np.concatenate([upper, lower[::-1]]),
+                            fill='toself', fillcolor=colour, opacity=0.15, line={'width': 0}, hoverinfo='skip',
+                            name=f'{territory} 95% band', showlegend=False)
+        fig.add_scatter(x=years, y=mean, mode='lines', line={'color': colour, 'dash': 'dash'},
+                        name=f'{territory} forecast')
+    return fig
+
+
+def panel_figure(spec, matrix, territory, relative=False, horizon=0, years=None):
+    """Line chart of the territory against Barcelona, or None if there is too little data.
+
+    With a `horizon` (annual data only) the trend forecast is drawn after the history.
+    `years` is an optional (first, last) year range that the chart and its CAGR cover.
+    """
+    territories = panel_territories(territory)
+    window = matrix.window(*years) if years else None
+    frame = panel_frame(matrix, territories, relative, window)
+    if len(frame) < 2:
+        return None
+    if relative:
+        y_axis_title = 'Relative Change (%)'
+        title_suffix = ' (Relative Change)'
+    else:
+        y_axis_title = spec.y_axis_title
+        title_suffix = ''
+    summary = rate_text(matrix, territory, window) if spec.is_rate else cagr_text(matrix, territory, relative, window)
+    if window is not None:
+        title_suffix += f' ({years[0]}–{years[1]})'
+    fig = px.line(frame, x=matrix.x_label, y=territories,
+                  title=f'{spec.title} in {territory}{title_suffix}<br>{summary}',
+                  labels={'value': y_axis_title})
+    # Projections continue from the latest data, so only when the window reaches it
+    if horizon and (window is None or window[1] == len(matrix.years) - 1):
+        add_forecast(fig, matrix, territories, horizon)
+    return fig
+
+
+def relative_key(spec):
+    return f'relative_{spec.key}'
+
+
+def relative_toggle(spec):
+    # Lives inside the panel's fragment, so flipping it only reruns that panel
+    return st.toggle('Relative change', key=relative_key(spec))
+
+
+def forecast_horizon(spec, freq, relative, horizon):
+    """Years to project for this panel: 0 unless its forecast toggle is on (annual levels only)."""
+    if freq != 'A' or relative or not horizon:
+        return 0
+    return horizon if st.toggle('Forecast', key=f'forecast_{spec.key}') else 0
+
+
+def typology_key(spec, typologies):
+    # Part of figure cache keys; None for indicators that are not split by property use
+    return tuple(typologies) if spec.by_typology and typologies else None
+
+
+def breakdown_toggle(spec, typologies):
+    """Property use caption and stacked-breakdown switch for indicators split by typology."""
+    if not spec.by_typology or not typologies:
+        return False
+    st.caption(f'Property use: {", ".join(typologies)}')
+    return st.toggle('Breakdown by property use', key=f'breakdown_{spec.key}')
+
+
+def breakdown_figure(spec, typology_cube, territory, typologies, years=None):
+    """Stacked area of the selected typologies for one territory, or None without data."""
+    if territory not in typology_cube:
+        return None
+    values = typology_cube.breakdown(territory, typologies)
+    observed = ~np.isnan(values).all(axis=0)
+    if years:
+        observed &= (typology_cube.years >= years[0]) & (typology_cube.years <= years[1])
+    if observed.sum() < 2:
+        return None
+    frame = pd.DataFrame(values[:, observed].T, index=pd.Index(typology_cube.years[observed], name='Year'),
+                         columns=pd.Index(typologies, name='Property use'))
+    return px.area(frame, title=f'{spec.title} in {territory} by Property Use',
+                   labels={'value': spec.y_axis_title})
+
+
+def breakdown_comparison_figure(spec, typology_cube, territories, typologies, years=None):
+    """Stacked bars of each territory's latest year (within `years`) split by the selected typologies."""
+    territories, latest, values = typology_cube.latest_breakdown(territories, typologies, years)
+    if not territories:
+        return None
+    index = pd.Index([f'{territory} ({year})' for territory, year in zip(territories, latest)], name='Territory')
+    frame = pd.DataFrame(values, index=index, columns=pd.Index(typologies, name='Property use'))
+    period = f'latest year in {years[0]}–{years[1]}' if years else 'latest year'
+    return px.bar(frame, title=f'{spec.title} by Property Use ({period})',
+                  labels={'value': spec.y_axis_title})
+
+
+def affordability_figure(matrix, metric, territories):
+    """One affordability ratio over the years for many territories, or None without data."""
+    frame = matrix.frame(metric, territories)
+    if frame.empty:
+        return None
+    return px.line(frame, title=LABELS[metric], labels={'value': LABELS[metric]})
+
+
+def correlation_figure(correlation):
+    """Annotated heatmap of an indicator correlation matrix."""
+    if correlation.empty:
+        return None
+    fig = px.imshow(correlation, text_auto='.2f', zmin=-1, zmax=1, color_continuous_scale='RdBu', aspect='auto',
+                    title='Correlation across territories and years')
+    return fig.update_layout(height=600)
+
+
+def render_panel(spec, cube, territory, relative=None, freq='A', how=None, typologies=None, horizon=0, years=None):
+    st.subheader(spec.subheader)
+    if relative is None:
+        relative = relative_toggle(spec)
+    horizon = forecast_horizon(spec, freq, relative, horizon)
+    if breakdown_toggle(spec, typologies):
+        with profiling.stage(spec.key, 'figure'):
+            fig = cached_figure(('breakdown', cube.versions[spec.key], spec.key, territory, tuple(typologies), years),
+                                lambda: breakdown_figure(spec, cube.typology(spec.key), territory, typologies, years))
+        if fig is None:
+            st.write(spec.empty_message)
+        else:
+            with profiling.stage(spec.key, 'serialise'):
+                st.plotly_chart(fig, use_container_width=True)
+        return
+
+    with profiling.stage(spec.key, 'load'):
+        matrix = cube.matrix(spec.key, freq, how, typologies)
+    with profiling.stage(spec.key, 'filter'):
+        missing = any(name not in matrix for name in panel_territories(territory))
+        window = matrix.window(*years) if years else None
+        suspicious = not missing and out_of_bounds(matrix, panel_territories(territory), window)
+    if missing:
+        st.write(spec.empty_message)
+        return
+
+    if suspicious:
+        st.warning(f'Some {spec.title.lower()} values look suspiciously low or high. Check your data source!')
+
+    with profiling.stage(spec.key, 'figure'):
+        fig = cached_figure(('panel', cube.versions[spec.key], spec.key, territory, relative, freq, how,
+                             typology_key(spec, typologies), horizon, years),
+                            lambda: panel_figure(spec, matrix, territory, relative, horizon, years))
+    if fig is None:
+        st.write(spec.empty_message)
+    else:
+        with profiling.stage(spec.key, 'serialise'):
+            st.plotly_chart(fig, use_container_width=True)
+
+
+def comparison_figure(spec, matrix, territories, relative=False, horizon=0, years=None):
+    """All territories on one chart, sliced from the matrix in a single indexing step."""
+    territories = [territory for territory in territories if territory in matrix]
+    if not territories:
+        return None
+    rows = np.array([matrix.index[territory] for territory in territories])
+    values = (matrix.relative if relative else matrix.values)[rows]
+    observed = ~np.isnan(values).all(axis=0)
+    window = matrix.window(*years) if years else None
+    if window is not None:
+        observed[:window[0]] = observed[window[1] + 1:] = False
+    if observed.sum() < 2:
+        return None
+
+    # CAGR of every selected territory at once (latest level for rates), shown in the legend
+    if relative:
+        names, legend_title = territories, 'Territory'
+    elif spec.is_rate:
+        last = matrix.span(rows, window)[1]
+        latest = np.where(last >= 0, matrix.values[rows, np.maximum(last, 0)], np.nan)
+        names = [f'{territory} ({value:.2f}%)' for territory, value in zip(territories, latest)]
+        legend_title = 'Territory (latest)'
+    else:
+        cagr = matrix.cagr[rows] if window is None else matrix.window_stats(rows, window)['cagr']
+        names = [f'{territory} ({value:.2f}%)' for territory, value in zip(territories, cagr)]
+        legend_title = 'Territory (CAGR)'
+    frame = pd.DataFrame(values[:, observed].T, index=pd.Index(matrix.x[observed], name=matrix.x_label),
+                         columns=pd.Index(names, name=legend_title))
+    y_axis_title = 'Relative Change (%)' if relative else spec.y_axis_title
+    title_suffix = ' (Relative Change)' if relative else ''
+    if window is not None:
+        title_suffix += f' ({years[0]}–{years[1]})'
+    fig = px.line(frame, title=f'{spec.title}{title_suffix}', labels={'value': y_axis_title})
+    # Sub-annual views mix annual and monthly history; bridge the missing months
+    fig.update_traces(connectgaps=True)
+    if horizon and (window is None or window[1] == len(matrix.years) - 1):
+        add_forecast(fig, matrix, territories, horizon, bands=False)
+    return fig
+
+
+def render_comparison_panel(spec, cube, territories, relative=None, freq='A', how=None, typologies=None, horizon=0,
+                            years=None):
+    st.subheader(spec.subheader)
+    if relative is None:
+        relative = relative_toggle(spec)
+    horizon = forecast_horizon(spec, freq, relative, horizon)
+
+    # On a cache miss the 'figure' stage includes loading the matrix
+    with profiling.stage(spec.key, 'figure'):
+        if breakdown_toggle(spec, typologies):
+            fig = cached_figure(('breakdown_comparison', cube.versions[spec.key], spec.key, tuple(territories),
+                                 tuple(typologies), years),
+                                lambda: breakdown_comparison_figure(spec, cube.typology(spec.key), territories,
+                                                                    typologies, years))
+        else:
+            fig = cached_figure(('comparison', cube.versions[spec.key], spec.key, tuple(territories), relative, freq,
+                                 how, typology_key(spec, typologies), horizon, years),
+                                lambda: comparison_figure(spec, cube.matrix(spec.key, freq, how, typologies),
+                                                          territories, relative, horizon, years))
+    if fig is None:
+        st.write('No data available for the selected territories.')
+    else:
+        with profiling.stage(spec.key, 'serialise'):
+            st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def panel_fragment(spec, cube, selection, compare=False, freq='A', how=None, typologies=None, horizon=0,
+                   years=None):
+    """Render one panel as an isolated fragment that reruns on its own widgets only."""
+    with profiling.fragment_run(f'fragment {spec.key}'):
+        if compare:
+            render_comparison_panel(spec, cube, selection, freq=freq, how=how, typologies=typologies,
+                                    horizon=horizon, years=years)
+        else:
+            render_panel(spec, cube, selection, freq=freq, how=how, typologies=typologies, horizon=horizon,
+                         years=years)
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+import pandas as pd
+import streamlit as st
+
+from data_loader import DATA_DIR
+from figure_cache import figures
+
+# Opt in with PISO_PROFILE=1 for the whole server, or ?profile=1 for one browser session.
+# Memory is only traced in the server-wide mode: tracemalloc slows every session down.
+ENV_VAR = 'PISO_PROFILE'
+QUERY_PARAM = 'profile'
+LOG_PATH = os.environ.get('PISO_PROFILE_LOG', os.path.join(DATA_DIR, '.cache', 'profile.jsonl'))
+PROMETHEUS_PATH = os.environ.get('PISO_PROFILE_PROM', os.path.join(DATA_DIR, '.cache', 'profile.prom'))
+# The JSONL log is rotated to <log>.1 once it grows past this size, in MB
+MAX_LOG_MB = float(os.environ.get('PISO_PROFILE_LOG_MAX_MB', 10))
+# Runs kept in memory for the p50/p95 summaries
+HISTORY = 500
+
+_state = threading.local()
+# tracemalloc's peak is process-wide, so traced stages of concurrent sessions take turns
+_memory_lock = threading.Lock()
+
+
+@dataclass
+class Stage:
+    panel: str
+    stage: str
+    seconds: float
+    # Peak traced allocation while the stage ran, above what was allocated when it started;
+    # None unless memory is traced (PISO_PROFILE)
+    peak_bytes: int = None
+
+
+@dataclass
+class RunRecord:
+    """Timings of one script run (or fragment rerun) and its stages."""
+    name: str
+    started: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    stages: list = field(default_factory=list)
+
+
+class Recorder:
+    """Recent runs of every session in this process, summarised as percentiles."""
+
+    def __init__(self, history=HISTORY):
+        self._runs = deque(maxlen=history)
+        self._lock = threading.Lock()
+        # Lifetime totals per run name, for the Prometheus counters
+        self._count = defaultdict(int)
+        self._sum = defaultdict(float)
+
+    def add(self, run):
+        with self._lock:
+            self._runs.append(run)
+            self._count[run.name] += 1
+            self._sum[run.name] += run.seconds
+
+    def runs(self):
+        with self._lock:
+            return list(self._runs)
+
+    def totals(self):
+        with self._lock:
+            return dict(self._count), dict(self._sum)
+
+    def run_summary(self):
+        """p50/p95 wall time per run name over the recent history."""
+        runs = self.runs()
+        frame = pd.DataFrame({'run': [run.name for run in runs], 'seconds': [run.seconds for run in runs]})
+        return summarise(frame, ['run'])
+
+    def stage_summary(self):
+        """p50/p95 wall time and peak memory per panel and stage over the recent history."""
+        rows = [asdict(stage) for run in self.runs() for stage in run.stages]
+        frame = pd.DataFrame(rows, columns=['panel', 'stage', 'seconds', 'peak_bytes'])
+        return summarise(frame, ['panel', 'stage'])
+
+
+def summarise(frame, keys):
+    if frame.empty:
+        return pd.DataFrame(columns=keys + ['count', 'p50_ms', 'p95_ms'])
+    grouped = frame.groupby(keys, sort=False)['seconds']
+    summary = pd.DataFrame({
+        'count': grouped.size(),
+        'p50_ms': grouped.quantile(0.5) * 1000,
+        'p95_ms': grouped.quantile(0.95) * 1000,
+    })
+    if 'peak_bytes' in frame and frame['peak_bytes'].notna().any():
+        peaks = pd.to_numeric(frame['peak_bytes']).groupby([frame[key] for key in keys], sort=False)
+        summary['p95_peak_kib'] = peaks.quantile(0.95) / 1024
+    return summary.reset_index()
+
+
+recorder = Recorder()
+
+
+def server_wide():
+    """True if profiling (including memory tracing) is switched on for the whole server."""
+    return os.environ.get(ENV_VAR, '').lower() in ('1', 'true', 'yes')
+
+
+def requested():
+    """True if profiling is switched on for the server or for this session's URL."""
+    if server_wide():
+        return True
+    try:
+        return st.query_params.get(QUERY_PARAM, '').lower() in ('1', 'true', 'yes')
+    except Exception:
+        # Outside a Streamlit script run (e.g. report.py) there are no query params
+        return False
+
+
+def active_run():
+    return getattr(_state, 'run', None)
+
+
+def start_run(name='rerun'):
+    """Start timing this script run if profiling is requested; returns the record or None.
+
+    ?profile=1 only records wall time; memory is traced when PISO_PROFILE is set.
+    """
+    if not requested():
+        _state.run = None
+        return None
+    _state.memory = server_wide()
+    if _state.memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.run = RunRecord(name)
+    _state.start = time.perf_counter()
+    return _state.run
+
+
+def finish_run():
+    """Stop timing the current run, record it and export it; returns the record or None."""
+    run = active_run()
+    if run is None:
+        return None
+    run.seconds = time.perf_counter() - _state.start
+    _state.run = None
+    recorder.add(run)
+    export(run)
+    return run
+
+
+@contextmanager
+def stage(panel, name):
+    """Time one stage of a panel (or 'app') when the current run is being profiled."""
+    run = active_run()
+    if run is None:
+        yield
+        return
+    if not (_state.memory and tracemalloc.is_tracing()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            run.stages.append(Stage(panel, name, time.perf_counter() - start))
+        return
+    # Other threads still allocate meanwhile, but no other stage resets the peak under this one
+    with _memory_lock:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            run.stages.append(Stage(panel, name, seconds, max(peak - before, 0)))
+
+
+@contextmanager
+def fragment_run(name):
+    """Profile a fragment rerun on its own; inside a profiled full run it is just part of that run."""
+    if active_run() is not None:
+        yield
+        return
+    start_run(name)
+    try:
+        yield
+    finally:
+        finish_run()
+
+
+def prometheus_text():
+    """Current summaries in the Prometheus text exposition format."""
+    lines = ['# HELP piso_run_seconds Wall time of dashboard script and fragment runs.',
+             '# TYPE piso_run_seconds summary']
+    counts, sums = recorder.totals()
+    for row in recorder.run_summary().itertuples():
+        lines.append(f'piso_run_seconds{{run="{row.run}",quantile="0.5"}} {row.p50_ms / 1000:.6f}')
+        lines.append(f'piso_run_seconds{{run="{row.run}",quantile="0.95"}} {row.p95_ms / 1000:.6f}')
+        lines.append(f'piso_run_seconds_sum{{run="{row.run}"}} {sums[row.run]:.6f}')
+        lines.append(f'piso_run_seconds_count{{run="{row.run}"}} {counts[row.run]}')
+    lines += ['# HELP piso_stage_seconds Wall time of panel stages over recent runs.',
+              '# TYPE piso_stage_seconds gauge']
+    for row in recorder.stage_summary().itertuples():
+        for quantile, value in (('0.5', row.p50_ms), ('0.95', row.p95_ms)):
+            lines.append(f'piso_stage_seconds{{panel="{row.panel}",stage="{row.stage}",quantile="{quantile}"}} '
+                         f'{value / 1000:.6f}')
+    stats = figures.stats()
+    lines += ['# HELP piso_figure_cache_hits_total Figure cache hits.', '# TYPE piso_figure_cache_hits_total counter',
+              f'piso_figure_cache_hits_total {stats["hits"]}',
+              '# HELP piso_figure_cache_misses_total Figure cache misses.',
+              '# TYPE piso_figure_cache_misses_total counter', f'piso_figure_cache_misses_total {stats["misses"]}',
+              '# HELP piso_figure_cache_bytes Serialised size of cached figures.',
+              '# TYPE piso_figure_cache_bytes gauge', f'piso_figure_cache_bytes {stats["bytes"]}']
+    return '\n'.join(lines) + '\n'
+
+
+def export(run, log_path=LOG_PATH, prometheus_path=PROMETHEUS_PATH, max_log_mb=MAX_LOG_MB):
+    """Append the run to the JSONL log (keeping one rotated file) and rewrite the Prometheus textfile."""
+    try:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        if os.path.exists(log_path) and os.path.getsize(log_path) > max_log_mb * 1024 * 1024:
+            os.replace(log_path, f'{log_path}.1')
+        with open(log_path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(asdict(run)) + '\n')
+        if prometheus_path:
+            os.makedirs(os.path.dirname(prometheus_path), exist_ok=True)
+            tmp_path = f'{prometheus_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                handle.write(prometheus_text())
+            os.replace(tmp_path, prometheus_path)
+    except OSError:
+        # Profiling must never break the dashboard
+        pass
+
+
+def debug_sidebar(run):
+    """Sidebar panel with this run's stages, recent p50/p95 and figure cache counters."""
+    if run is None:
+        return
+    with st.sidebar.expander('Profiler', expanded=True):
+        st.write(f'This run: {run.seconds * 1000:.0f} ms')
+        stages = pd.DataFrame([asdict(stage) for stage in run.stages], columns=['panel', 'stage', 'seconds', 'peak_bytes'])
+        stages['ms'] = stages.pop('seconds') * 1000
+        peaks = stages.pop('peak_bytes')
+        if peaks.notna().any():
+            stages['peak_kib'] = pd.to_numeric(peaks) / 1024
+        st.dataframe(stages.round(1), hide_index=True)
+        st.write('Recent runs (p50 / p95)')
+        st.dataframe(recorder.run_summary().round(1), hide_index=True)
+        st.dataframe(recorder.stage_summary().round(1), hide_index=True)
+        stats = figures.stats()
+        st.write(f'Figure cache: {stats["entries"]} figures, {stats["bytes"] / 2 ** 20:.2f} MB, '
+                 f'hit rate {stats["hit_rate"] * 100:.0f}% ({stats["hits"]} hits, {stats["evictions"]} evictions)')
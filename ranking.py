@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DEFAULT_LEVELS
+from indicators import PANELS
+from yields import yield_matrix
+
+_lock = threading.Lock()
+_rankings = {}
+
+
+def indicator_columns(spec, matrix, territories):
+    """Latest value, its year-over-year change and CAGR for many territories at once."""
+    rows = np.array([matrix.index.get(territory, -1) for territory in territories], dtype=int)
+    observed = rows >= 0
+    rows = np.where(observed, rows, 0)
+    last = matrix.last[rows]
+    observed &= last >= 0
+    last = np.where(observed, last, 0)
+
+    latest = np.where(observed, matrix.values[rows, last], np.nan)
+    yoy = np.where(observed, matrix.relative[rows, last], np.nan)
+
+    columns = {
+        f'{spec.title} (latest)': latest,
+        f'{spec.title} YoY (%)': yoy,
+    }
+    if not spec.is_rate:
+        columns[f'{spec.title} CAGR (%)'] = np.where(observed, matrix.cagr[rows], np.nan)
+    return columns
+
+
+# Descriptive columns ahead of the indicator values
+DESCRIPTIVE_COLUMNS = ['Level', 'District']
+
+
+def build_ranking(cube, levels=DEFAULT_LEVELS):
+    territories = cube.territories(levels)
+    columns = {
+        'Level': [cube.levels[territory] for territory in territories],
+        'District': [cube.districts[territory] for territory in territories],
+    }
+    for spec in PANELS:
+        columns.update(indicator_columns(spec, cube[spec.key], territories))
+    yields = yield_matrix(cube.store)
+    columns['Price-to-rent (latest)'] = yields.latest_values('price_to_rent', territories)
+    columns['Payback (years, latest)'] = yields.latest_values('payback', territories)
+    table = pd.DataFrame(columns, index=pd.Index(territories, name='Territory'))
+    # Drop indicators with no data at these levels (e.g. income for barris); 'District' stays even
+    # though it is empty for the city
+    indicators = table.drop(columns=DESCRIPTIVE_COLUMNS).dropna(axis=1, how='all')
+    return table[DESCRIPTIVE_COLUMNS].join(indicators)
+
+
+def ranking_table(cube, levels=DEFAULT_LEVELS):
+    """All-territory ranking table, cached per cube version and level selection.
+
+    The frame is shared between sessions: treat it as read-only.
+    """
+    key = (cube.version, tuple(levels))
+    with _lock:
+        if key not in _rankings:
+            for stale in [cached for cached in _rankings if cached[0] != cube.version]:
+                del _rankings[stale]
+            _rankings[key] = build_ranking(cube, levels)
+        return _rankings[key]
@@ -0,0 +1,168 @@
+"""Merge newly downloaded portaldades exports into data/ without a cold rebuild.
+
+    python refresh.py ~/Downloads/portaldades              # append new periods
+    python refresh.py ~/Downloads/portaldades --dry-run    # only report the differences
+    python refresh.py ~/Downloads/portaldades --revisions  # also take revised past values
+
+The export directory mirrors data/: one folder per dataset (named as in
+data_loader.DATASETS) holding 'Statistical table.csv' and 'Metadata.txt'.
+Datasets missing from it are left alone. Each export is diffed against the
+current CSV row by row (territory, location type, property use) and period by
+period; new periods are appended to the CSV and their tidy rows to the store,
+whose snapshot is rewritten with the new digests. A running dashboard picks the
+snapshot up on its next rerun and only rebuilds what depends on the changed
+exports, since its matrices, yields, forecasts and figures are keyed by the
+digests of their sources.
+"""
+import argparse
+import os
+import shutil
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_DIR, DATASETS, ID_COLUMNS, dataset_path, load_metadata, parse_period, source_digest
+from data_store import SNAPSHOT_PATH, load_store, replace_store, tidy_dataset
+from validation import validate_dataset
+
+# Raw id columns of an export; 'District' is only added while parsing
+KEY_COLUMNS = [column for column in ID_COLUMNS if column != 'District']
+
+
+@dataclass(frozen=True)
+class DatasetDiff:
+    """How one incoming export differs from the current one."""
+    name: str
+    published: str
+    current_published: str
+    new_periods: tuple = ()
+    # Cells of periods both exports have whose value (or missing marker) changed
+    revised: int = 0
+    new_territories: tuple = ()
+    dropped_territories: tuple = ()
+
+    def summary(self):
+        parts = [f'{len(self.new_periods)} new period(s)', f'{self.revised} revised value(s)']
+        if self.new_periods:
+            parts[0] += f' ({", ".join(dict.fromkeys([self.new_periods[0], self.new_periods[-1]]))})'
+        if self.new_territories:
+            parts.append(f'{len(self.new_territories)} new territories ignored')
+        if self.dropped_territories:
+            parts.append(f'{len(self.dropped_territories)} territories missing from the export')
+        return f'{self.name}: ' + ', '.join(parts) + f'; published {self.published or "?"} (current {self.current_published or "?"})'
+
+
+def read_raw(path):
+    """An export as strings, indexed by its id columns, so markers such as '..' survive a merge."""
+    table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return table.set_index([column for column in KEY_COLUMNS if column in table.columns])
+
+
+def periods_of(table):
+    return {parse_period(label): label for label in table.columns}
+
+
+def diff_dataset(name, export_dir, data_dir=DATA_DIR):
+    """Compare the export in `export_dir` with the current one; None if the export is absent."""
+    path = dataset_path(name, data_dir=export_dir)
+    if not os.path.exists(path):
+        return None
+    current, incoming = read_raw(dataset_path(name, data_dir=data_dir)), read_raw(path)
+    current_periods, incoming_periods = periods_of(current), periods_of(incoming)
+    new_periods = tuple(incoming_periods[date] for date in sorted(incoming_periods.keys() - current_periods.keys()))
+
+    rows = current.index.intersection(incoming.index)
+    common = sorted(current_periods.keys() & incoming_periods.keys())
+    before = current.loc[rows, [current_periods[date] for date in common]].to_numpy()
+    after = incoming.loc[rows, [incoming_periods[date] for date in common]].to_numpy()
+    revised = int((np.char.strip(before.astype(str)) != np.char.strip(after.astype(str))).sum())
+
+    metadata_path = dataset_path(name, 'Metadata.txt', data_dir=export_dir)
+    published = load_metadata(name, data_dir=export_dir) if os.path.exists(metadata_path) else {}
+    return DatasetDiff(
+        name=name,
+        published=published.get('publication date', ''),
+        current_published=load_metadata(name, data_dir=data_dir).get('publication date', ''),
+        new_periods=new_periods,
+        revised=revised,
+        new_territories=tuple(' / '.join(key) for key in incoming.index.difference(current.index)),
+        dropped_territories=tuple(' / '.join(key) for key in current.index.difference(incoming.index)),
+    )
+
+
+def merge_dataset(diff, export_dir, data_dir=DATA_DIR, revisions=False):
+    """Rewrite the current CSV with the export's new periods (and revisions) appended.
+
+    Rows keep the current export's order, which the district of each barri is
+    derived from. Territories the export no longer lists get '-' (missing) for
+    the new periods; territories it adds are not taken over.
+    """
+    path = dataset_path(diff.name, data_dir=data_dir)
+    current, incoming = read_raw(path), read_raw(dataset_path(diff.name, data_dir=export_dir))
+    rows = current.index.intersection(incoming.index)
+    if revisions:
+        incoming_periods = periods_of(incoming)
+        for date, label in periods_of(current).items():
+            if date in incoming_periods:
+                current.loc[rows, label] = incoming.loc[rows, incoming_periods[date]]
+    added = incoming.reindex(current.index)[list(diff.new_periods)].fillna('-')
+    merged = pd.concat([current, added], axis=1)
+    # Keep the export's chronological column order
+    periods = sorted(periods_of(merged).items())
+    merged = merged[[label for _, label in periods]].reset_index()
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    merged.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    metadata_path = dataset_path(diff.name, 'Metadata.txt', data_dir=export_dir)
+    if os.path.exists(metadata_path):
+        shutil.copy(metadata_path, dataset_path(diff.name, 'Metadata.txt', data_dir=data_dir))
+
+
+def refresh(export_dir, data_dir=DATA_DIR, snapshot_path=SNAPSHOT_PATH, revisions=False, dry_run=False):
+    """Diff, merge and re-snapshot every changed dataset; returns the diffs of the exports found."""
+    diffs = [diff for diff in (diff_dataset(name, export_dir, data_dir) for name in DATASETS) if diff is not None]
+    changed = [diff for diff in diffs if diff.new_periods or (revisions and diff.revised)]
+    if dry_run or not changed:
+        return diffs
+
+    store = load_store(data_dir=data_dir, snapshot_path=snapshot_path)
+    for diff in changed:
+        merge_dataset(diff, export_dir, data_dir, revisions)
+        digest = source_digest(diff.name, data_dir=data_dir)
+        metadata = load_metadata(diff.name, data_dir=data_dir)
+        quality = validate_dataset(diff.name, data_dir=data_dir)
+        if revisions and diff.revised:
+            # Revised history touches every period: re-tidy this one export
+            store = store.updated(diff.name, tidy_dataset(diff.name, data_dir=data_dir), digest, metadata, quality,
+                                  replace=True)
+        else:
+            rows = tidy_dataset(diff.name, data_dir=data_dir, periods=diff.new_periods)
+            store = store.updated(diff.name, rows, digest, metadata, quality)
+    replace_store(store, data_dir, snapshot_path)
+    return diffs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge new portaldades exports into the dashboard data.')
+    parser.add_argument('export_dir', help='directory with one folder per dataset, laid out like data/')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--revisions', action='store_true', help='also apply changed values of existing periods')
+    parser.add_argument('--dry-run', action='store_true', help='report the differences without writing anything')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.export_dir):
+        parser.error(f'{args.export_dir} is not a directory')
+
+    snapshot_path = os.path.join(args.data_dir, '.cache', 'indicators.arrow')
+    diffs = refresh(args.export_dir, args.data_dir, snapshot_path, args.revisions, args.dry_run)
+    if not diffs:
+        print(f'No exports found in {args.export_dir}')
+    for diff in diffs:
+        print(diff.summary())
+        if diff.revised and not args.revisions:
+            print('  revised values kept as they were (use --revisions to take them)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Headless report of every indicator panel for every territory.
+
+    python report.py --output reports --format html --workers 4
+
+Each territory gets its own page with every dashboard chart (against
+Barcelona, as in the app), and index.html links all pages. Charts are built
+with the same panel code as streamlit_app.py, in parallel across a process
+pool. manifest.json records a fingerprint of each territory's inputs so later
+runs only re-render territories whose data changed. Static formats (png, svg,
+pdf) need the optional `kaleido` package.
+"""
+import argparse
+import hashlib
+import html
+import importlib.util
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from plotly.offline import get_plotlyjs
+
+from data_loader import ALL_LEVELS
+from data_store import load_store
+from indicator_cube import load_cube
+from indicators import PANELS
+from panels import REFERENCE_TERRITORY, out_of_bounds, panel_figure, panel_territories
+
+# Bump when the page layout changes so every page is rendered again
+REPORT_VERSION = 1
+FORMATS = ('html', 'png', 'svg', 'pdf')
+MANIFEST_NAME = 'manifest.json'
+PLOTLYJS_NAME = 'plotly.min.js'
+
+_cube = None
+
+
+def slugify(territory):
+    ascii_name = unicodedata.normalize('NFKD', territory).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', ascii_name.lower()).strip('-')
+
+
+def page_names(cube):
+    """Unique file name stem of every territory's page.
+
+    Names that slugify alike (the district 'Les Corts' and the barri 'les
+    Corts') get their level appended, and a short hash of the name if that
+    still collides. All levels are considered so a name never depends on --levels.
+    """
+    territories = cube.territories(ALL_LEVELS)
+    if REFERENCE_TERRITORY not in territories:
+        territories.insert(0, REFERENCE_TERRITORY)
+    slugs = {territory: slugify(territory) for territory in territories}
+    counts = Counter(slugs.values())
+    for territory, slug in slugs.items():
+        if counts[slug] > 1:
+            slugs[territory] = f'{slug}-{slugify(cube.levels.get(territory, ""))}'.rstrip('-')
+    counts = Counter(slugs.values())
+    for territory, slug in slugs.items():
+        if counts[slug] > 1:
+            slugs[territory] = f'{slug}-{hashlib.sha256(territory.encode()).hexdigest()[:8]}'
+    return slugs
+
+
+def territory_fingerprint(cube, territory, fmt):
+    """Hash of everything a territory's page depends on: its and Barcelona's series."""
+    digest = hashlib.sha256(f'{REPORT_VERSION}|{fmt}|{territory}'.encode())
+    for spec in PANELS:
+        matrix = cube[spec.key]
+        digest.update(spec.key.encode())
+        digest.update(matrix.years.tobytes())
+        for name in panel_territories(territory):
+            if name in matrix:
+                digest.update(np.ascontiguousarray(matrix.series(name)).tobytes())
+    return digest.hexdigest()
+
+
+def _init_worker():
+    # Each worker memory-maps the snapshot once and reuses the cube for all its territories
+    global _cube
+    _cube = load_cube(load_store())
+
+
+def chart_html(fig, fmt, directory, name):
+    if fmt == 'html':
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+    os.makedirs(directory, exist_ok=True)
+    fig.write_image(os.path.join(directory, f'{name}.{fmt}'))
+    src = html.escape(f'{os.path.basename(directory)}/{name}.{fmt}')
+    if fmt == 'pdf':
+        return f'<object data="{src}" type="application/pdf" width="100%" height="480"></object>'
+    return f'<img src="{src}" alt="{html.escape(name)}">'
+
+
+def render_territory(territory, slug, output, fmt):
+    """Write one territory's page `<slug>.html` (and static images) and return its file name."""
+    cube = _cube or load_cube(load_store())
+    sections = []
+    for spec in PANELS:
+        matrix = cube[spec.key]
+        sections.append(f'<h2>{html.escape(spec.subheader)}</h2>')
+        if any(name not in matrix for name in panel_territories(territory)):
+            sections.append(f'<p>{html.escape(spec.empty_message)}</p>')
+            continue
+        if out_of_bounds(matrix, panel_territories(territory)):
+            sections.append(f'<p class="warning">Some {spec.title.lower()} values look suspiciously low or high. '
+                            f'Check your data source!</p>')
+        fig = panel_figure(spec, matrix, territory)
+        if fig is None:
+            sections.append(f'<p>{html.escape(spec.empty_message)}</p>')
+        else:
+            sections.append(chart_html(fig, fmt, os.path.join(output, slug), spec.key))
+
+    page = f'{slug}.html'
+    script = f'<script src="{PLOTLYJS_NAME}"></script>' if fmt == 'html' else ''
+    with open(os.path.join(output, page), 'w', encoding='utf-8') as handle:
+        handle.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(territory)}</title>'
+                     f'{script}</head><body><p><a href="index.html">All territories</a></p>'
+                     f'<h1>{html.escape(territory)}</h1>{"".join(sections)}</body></html>')
+    return page
+
+
+def write_index(output, cube, territories, pages):
+    rows = ''.join(f'<li><a href="{html.escape(pages[territory])}">{html.escape(territory)}</a> '
+                   f'({html.escape(cube.levels[territory])})</li>' for territory in territories)
+    with open(os.path.join(output, 'index.html'), 'w', encoding='utf-8') as handle:
+        handle.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Barcelona indicators</title></head>'
+                     f'<body><h1>Barcelona indicators</h1><ul>{rows}</ul></body></html>')
+
+
+def read_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def generate(output='reports', fmt='html', levels=ALL_LEVELS, workers=None, force=False):
+    """Render every territory whose inputs changed; returns (rendered, skipped) counts."""
+    store = load_store()
+    cube = load_cube(store)
+    territories = cube.territories(levels)
+    if REFERENCE_TERRITORY not in territories:
+        territories.insert(0, REFERENCE_TERRITORY)
+    os.makedirs(output, exist_ok=True)
+    if fmt == 'html':
+        with open(os.path.join(output, PLOTLYJS_NAME), 'w', encoding='utf-8') as handle:
+            handle.write(get_plotlyjs())
+
+    manifest_path = os.path.join(output, MANIFEST_NAME)
+    previous = read_manifest(manifest_path).get('territories', {})
+    fingerprints = {territory: territory_fingerprint(cube, territory, fmt) for territory in territories}
+    slugs = page_names(cube)
+    pending = [territory for territory in territories
+               if force or previous.get(territory, {}).get('fingerprint') != fingerprints[territory]
+               or previous[territory].get('page') != f'{slugs[territory]}.html'
+               or not os.path.exists(os.path.join(output, previous[territory]['page']))]
+
+    pages = {territory: previous[territory]['page'] for territory in territories if territory not in pending}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(render_territory, territory, slugs[territory], output, fmt): territory for territory in pending}
+            for future in as_completed(futures):
+                pages[futures[future]] = future.result()
+
+    write_index(output, cube, territories, pages)
+    manifest = {
+        'version': store.version,
+        'format': fmt,
+        'territories': {territory: {'fingerprint': fingerprints[territory], 'page': pages[territory]}
+                        for territory in territories},
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=2, ensure_ascii=False)
+    return len(pending), len(territories) - len(pending)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render every indicator panel for every territory.')
+    parser.add_argument('--output', default='reports', help='directory for the report bundle')
+    parser.add_argument('--format', choices=FORMATS, default='html', dest='fmt',
+                        help='interactive html charts, or static images (needs kaleido)')
+    parser.add_argument('--levels', nargs='+', choices=ALL_LEVELS, default=list(ALL_LEVELS))
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='re-render territories whose inputs are unchanged')
+    args = parser.parse_args(argv)
+    if args.fmt != 'html' and importlib.util.find_spec('kaleido') is None:
+        parser.error(f'--format {args.fmt} needs the kaleido package (pip install kaleido)')
+
+    rendered, skipped = generate(args.output, args.fmt, args.levels, args.workers, args.force)
+    print(f'Rendered {rendered} territories, {skipped} unchanged, in {args.output}')
+
+
+if __name__ == '__main__':
+    main()
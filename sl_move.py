@@ -1,13 +1,29 @@
+import numpy as np
+import plotly.graph_objects as go
 import streamlit as st
 
+from data_store import load_store
+from move_calc import (METRICS, PARAMETERS, break_even, evaluate, grid, recommendation, sweep_parameters, sweep_range,
+                       tornado)
+from move_simulation import SimulationConfig, percentile_bands, probability_es_better, simulate, with_fitted_rent
+from tax_brackets import tax_system
+from yields import YieldAssumptions, yield_matrix
+
 st.title("Vergleich Schweiz vs. Spanien")
 
 st.sidebar.header("Eingabeparameter")
 
+modus = st.sidebar.radio("Modus", ["Einzelszenario", "Szenario-Analyse", "Monte-Carlo-Simulation"], key="modus")
+steuermodell = st.sidebar.radio("Steuermodell", ["Pauschaler Steuersatz", "Progressive Tarife (Zürich / Katalonien)"],
+                                key="steuermodell")
+progressiv = steuermodell != "Pauschaler Steuersatz"
+# Bundessteuer + Kanton/Stadt Zürich bzw. IRPF Staat + Katalonien, aus data/tax_brackets
+steuern = {land: tax_system(land) for land in ("ch", "es")} if progressiv else None
+
 # Eingabewerte
 brutto = st.sidebar.number_input("Bruttojahreseinkommen", value=60000.0, step=1000.0)
-steuersatz_ch = st.sidebar.slider("Steuersatz Schweiz (%)", min_value=0.0, max_value=50.0, value=20.0)
-steuersatz_es = st.sidebar.slider("Steuersatz Spanien (%)", min_value=0.0, max_value=50.0, value=30.0)
+steuersatz_ch = st.sidebar.slider("Steuersatz Schweiz (%)", min_value=0.0, max_value=50.0, value=20.0, disabled=progressiv)
+steuersatz_es = st.sidebar.slider("Steuersatz Spanien (%)", min_value=0.0, max_value=50.0, value=30.0, disabled=progressiv)
 
 soz_ch = st.sidebar.slider("Sozialversicherungsbeiträge Schweiz (%)", min_value=0.0, max_value=20.0, value=10.0)
 soz_es = st.sidebar.slider("Sozialversicherungsbeiträge Spanien (%)", min_value=0.0, max_value=20.0, value=7.0)
@@ -16,43 +32,72 @@ kk_ch = st.sidebar.number_input("Monatl. Krankenkasse Schweiz (CHF/EUR)", value=
 kk_es = st.sidebar.number_input("Monatl. Krankenkasse Spanien (CHF/EUR)", value=100.0, step=10.0)
 
 miete_ch = st.sidebar.number_input("Monatl. Miete Schweiz (CHF/EUR)", value=2000.0, step=100.0)
-miete_es = st.sidebar.number_input("Monatl. Miete Spanien (CHF/EUR)", value=1200.0, step=100.0)
+# Miete Spanien optional aus den Mietpreisen (€/m²) eines Barcelona-Gebiets übernehmen
+miete_aus_daten = st.sidebar.checkbox("Miete Spanien aus Mietpreisdaten Barcelona", key="miete_aus_daten")
+if miete_aus_daten:
+    # Kosten für die Nettorendite; jede Kombination wird pro Datenstand zwischengespeichert
+    standard_rendite = YieldAssumptions()
+    with st.sidebar.expander("Annahmen Nettorendite"):
+        annahmen = YieldAssumptions(
+            vacancy=st.slider("Leerstand (%)", 0.0, 30.0, standard_rendite.vacancy, key="leerstand"),
+            ibi=st.slider("IBI Grundsteuer (% des Kaufpreises/Jahr)", 0.0, 2.0, standard_rendite.ibi, step=0.05,
+                          key="ibi"),
+            community_fees=st.slider("Gemeinschaftskosten (€/m²/Monat)", 0.0, 10.0, standard_rendite.community_fees,
+                                     step=0.1, key="gemeinschaftskosten"),
+            maintenance=st.slider("Unterhalt und Verwaltung (% der Miete)", 0.0, 30.0, standard_rendite.maintenance,
+                                  key="unterhalt"),
+            purchase_tax=st.slider("Grunderwerbsteuer ITP/IVA (%)", 0.0, 15.0, standard_rendite.purchase_tax,
+                                   step=0.5, key="grunderwerbsteuer"),
+            purchase_costs=st.slider("Notar, Register und Makler (%)", 0.0, 10.0, standard_rendite.purchase_costs,
+                                     step=0.5, key="kaufnebenkosten"),
+        )
+    renditen = yield_matrix(load_store(), annahmen)
+    gebiete = [gebiet for gebiet in renditen.territories if renditen.latest(gebiet) is not None]
+    gebiet = st.sidebar.selectbox("Gebiet", gebiete, index=gebiete.index("Barcelona") if "Barcelona" in gebiete else 0,
+                                  key="gebiet")
+    flaeche = st.sidebar.number_input("Wohnfläche (m²)", min_value=10.0, value=70.0, step=5.0, key="flaeche")
+    kennzahlen = renditen.latest(gebiet)
+    miete_es = st.sidebar.number_input("Monatl. Miete Spanien (CHF/EUR)", value=round(kennzahlen["rent"] * flaeche, 2),
+                                       step=100.0, disabled=True)
+    st.sidebar.caption(f"{gebiet} {kennzahlen['year']}: {kennzahlen['rent']:.2f} €/m² Miete, "
+                       f"{kennzahlen['price']:.0f} €/m² Kaufpreis. Bruttorendite {kennzahlen['gross']:.2f}%, "
+                       f"Nettorendite {kennzahlen['net']:.2f}%, Preis-Miete-Verhältnis "
+                       f"{kennzahlen['price_to_rent']:.1f}, Amortisation {kennzahlen['payback']:.0f} Jahre")
+else:
+    miete_es = st.sidebar.number_input("Monatl. Miete Spanien (CHF/EUR)", value=1200.0, step=100.0)
 
 leb_ch = st.sidebar.number_input("Jährl. Lebenshaltungskosten Schweiz (CHF/EUR)", value=12000.0, step=1000.0)
 leb_es = st.sidebar.number_input("Jährl. Lebenshaltungskosten Spanien (CHF/EUR)", value=10000.0, step=1000.0)
 
 wechselkurs = st.sidebar.number_input("Wechselkurs (CHF zu EUR)", value=1.0, step=0.01)
 
-# Berechnungen für die Schweiz
-steuern_ch = brutto * (steuersatz_ch / 100.0)
-sozial_ch = brutto * (soz_ch / 100.0)
-kk_ch_jahr = kk_ch * 12
-miete_ch_jahr = miete_ch * 12
-
-netto_ch = brutto - steuern_ch - sozial_ch - kk_ch_jahr
-gesamtkosten_ch = steuern_ch + sozial_ch + kk_ch_jahr + miete_ch_jahr + leb_ch
-sparpotenzial_ch = netto_ch - (miete_ch_jahr + leb_ch)
-
-# Berechnungen für Spanien
-steuern_es = brutto * (steuersatz_es / 100.0)
-sozial_es = brutto * (soz_es / 100.0)
-kk_es_jahr = kk_es * 12
-miete_es_jahr = miete_es * 12
-
-netto_es = brutto - steuern_es - sozial_es - kk_es_jahr
-gesamtkosten_es = steuern_es + sozial_es + kk_es_jahr + miete_es_jahr + leb_es
-sparpotenzial_es = netto_es - (miete_es_jahr + leb_es)
+# Berechnungen für beide Länder (gleiche Formeln wie die Szenario-Analyse)
+eingaben = {
+    "brutto": brutto,
+    "steuersatz_ch": steuersatz_ch,
+    "steuersatz_es": steuersatz_es,
+    "soz_ch": soz_ch,
+    "soz_es": soz_es,
+    "kk_ch": kk_ch,
+    "kk_es": kk_es,
+    "miete_ch": miete_ch,
+    "miete_es": miete_es,
+    "leb_ch": leb_ch,
+    "leb_es": leb_es,
+}
+ergebnis = {name: float(wert) for name, wert in evaluate(eingaben, steuern).items()}
+
+netto_ch = ergebnis["netto_ch"]
+gesamtkosten_ch = ergebnis["gesamtkosten_ch"]
+sparpotenzial_ch = ergebnis["sparpotenzial_ch"]
+
+netto_es = ergebnis["netto_es"]
+gesamtkosten_es = ergebnis["gesamtkosten_es"]
+sparpotenzial_es = ergebnis["sparpotenzial_es"]
 
 # Vergleich
-if netto_ch > netto_es:
-    empfehlung_netto = "Schweiz"
-else:
-    empfehlung_netto = "Spanien"
-
-if sparpotenzial_ch > sparpotenzial_es:
-    empfehlung_spar = "Schweiz"
-else:
-    empfehlung_spar = "Spanien"
+empfehlung_netto = str(recommendation(ergebnis["netto_diff"]))
+empfehlung_spar = str(recommendation(ergebnis["sparpotenzial_diff"]))
 
 col1, col2 = st.columns(2)
 
@@ -61,18 +106,150 @@ with col1:
     st.write(f"Nettoeinkommen: {netto_ch:.2f}")
     st.write(f"Sparpotenzial: {sparpotenzial_ch:.2f}")
     st.write(f"Gesamtkosten: {gesamtkosten_ch:.2f}")
+    if progressiv:
+        steuerbar_ch = brutto * (1 - soz_ch / 100.0)
+        st.caption(f"Effektiver Steuersatz: {float(steuern['ch'].average_rate(steuerbar_ch)):.2f}% "
+                   f"des steuerbaren Einkommens")
 
 with col2:
     st.subheader("Spanien")
     st.write(f"Nettoeinkommen: {netto_es:.2f}")
     st.write(f"Sparpotenzial: {sparpotenzial_es:.2f}")
     st.write(f"Gesamtkosten: {gesamtkosten_es:.2f}")
+    if progressiv:
+        steuerbar_es = brutto * (1 - soz_es / 100.0)
+        st.caption(f"Effektiver Steuersatz: {float(steuern['es'].average_rate(steuerbar_es)):.2f}% "
+                   f"des steuerbaren Einkommens")
 
 st.markdown("---")
 st.subheader("Empfehlung")
 st.write(f"Basierend auf Nettoeinkommen: **{empfehlung_netto}** ist vorteilhafter.")
 st.write(f"Basierend auf Sparpotenzial: **{empfehlung_spar}** ist vorteilhafter.")
 
+if modus == "Szenario-Analyse":
+    # Tausende Kombinationen in einem NumPy-Durchlauf statt einer Neuberechnung pro Slider
+    st.markdown("---")
+    st.subheader("Szenario-Analyse")
+    namen = sweep_parameters(steuern)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        x_name = st.selectbox("X-Achse", namen, index=namen.index("brutto"), format_func=PARAMETERS.get, key="x_name")
+    with col2:
+        y_standard = "miete_ch" if progressiv else "steuersatz_ch"
+        y_optionen = [name for name in namen if name != x_name]
+        y_name = st.selectbox("Y-Achse", y_optionen, format_func=PARAMETERS.get, key="y_name",
+                              index=y_optionen.index(y_standard) if y_standard in y_optionen else 0)
+    with col3:
+        metrik = st.selectbox("Kennzahl", list(METRICS), index=list(METRICS).index("sparpotenzial"),
+                              format_func=METRICS.get, key="metrik")
+
+    x_min, x_max = sweep_range(x_name, eingaben[x_name])
+    y_min, y_max = sweep_range(y_name, eingaben[y_name])
+    x_bereich = st.slider(f"Bereich {PARAMETERS[x_name]}", x_min, x_max, (x_min, x_max), key=f"bereich_{x_name}")
+    y_bereich = st.slider(f"Bereich {PARAMETERS[y_name]}", y_min, y_max, (y_min, y_max), key=f"bereich_{y_name}")
+    punkte = st.slider("Rasterpunkte pro Achse", min_value=10, max_value=300, value=100, step=10, key="punkte")
+
+    x_werte = np.linspace(*x_bereich, punkte)
+    y_werte = np.linspace(*y_bereich, punkte)
+    differenz = grid(eingaben, x_name, x_werte, y_name, y_werte, steuern)[f"{metrik}_diff"]
+    differenz = np.broadcast_to(differenz, (len(y_werte), len(x_werte)))
+    schwelle = break_even(eingaben, x_name, x_werte, y_name, metric=metrik, taxes=steuern, y_values=y_werte)
+    sichtbar = (schwelle >= y_bereich[0]) & (schwelle <= y_bereich[1])
+
+    fig = go.Figure(go.Heatmap(x=x_werte, y=y_werte, z=differenz, colorscale="RdBu", zmid=0,
+                               colorbar={"title": "CH − ES"}))
+    fig.add_trace(go.Scatter(x=x_werte[sichtbar], y=schwelle[sichtbar], mode="lines", name="Break-even",
+                             line={"color": "black", "width": 2}))
+    fig.update_layout(title=f"{METRICS[metrik]}: Schweiz minus Spanien",
+                      xaxis_title=PARAMETERS[x_name], yaxis_title=PARAMETERS[y_name])
+    st.plotly_chart(fig, use_container_width=True)
+    st.write(f"Schweiz ist in {(differenz > 0).mean() * 100:.1f}% der {differenz.size} Kombinationen vorteilhafter "
+             f"(blau: Schweiz, rot: Spanien).")
+
+    st.subheader("Sensitivität des Sparpotenzials")
+    spanne = st.slider("Variation je Parameter (%)", min_value=5, max_value=50, value=20, step=5, key="spanne")
+    tabelle, basis = tornado(eingaben, spread=spanne / 100, taxes=steuern)
+    tabelle = tabelle.iloc[::-1]
+    fig = go.Figure([
+        go.Bar(y=tabelle["parameter"], x=tabelle["low"], base=basis, orientation="h", name=f"−{spanne}%"),
+        go.Bar(y=tabelle["parameter"], x=tabelle["high"], base=basis, orientation="h", name=f"+{spanne}%"),
+    ])
+    fig.update_layout(barmode="overlay", title="Sparpotenzial Schweiz minus Spanien",
+                      xaxis_title="Differenz Sparpotenzial (CH − ES)")
+    fig.add_vline(x=0, line_color="black")
+    st.plotly_chart(fig, use_container_width=True)
+
+    if progressiv:
+        st.subheader("Steuerbelastung")
+        einkommen = np.linspace(0, max(2 * brutto, 1.0), 500)
+        fig = go.Figure([
+            go.Scatter(x=einkommen, y=steuern["ch"].average_rate(einkommen), name="Schweiz (Bund + Zürich)"),
+            go.Scatter(x=einkommen, y=steuern["es"].average_rate(einkommen), name="Spanien (Staat + Katalonien)"),
+        ])
+        fig.update_layout(title="Durchschnittlicher Steuersatz", xaxis_title="Steuerbares Einkommen",
+                          yaxis_title="Steuersatz (%)")
+        st.plotly_chart(fig, use_container_width=True)
+
+if modus == "Monte-Carlo-Simulation":
+    # Alle Szenarien und Jahre als Arrays in einem Durchlauf; gleicher Seed, gleiche Ergebnisse
+    st.markdown("---")
+    st.subheader("Monte-Carlo-Simulation")
+    standard = SimulationConfig()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        szenarien = st.number_input("Anzahl Szenarien", min_value=1000, max_value=200000, value=standard.scenarios,
+                                    step=1000, key="szenarien")
+        jahre = st.slider("Horizont (Jahre)", min_value=1, max_value=20, value=standard.years, key="jahre")
+        seed = st.number_input("Seed", min_value=0, value=standard.seed, step=1, key="seed")
+    with col2:
+        miete_ch_drift = st.slider("Mietentwicklung Schweiz (%/Jahr)", -5.0, 10.0, standard.rent_ch_drift,
+                                   key="mc_miete_ch")
+        miete_ch_vol = st.slider("Mietvolatilität Schweiz (%/Jahr)", 0.0, 20.0, standard.rent_ch_volatility,
+                                 key="mc_miete_ch_vol")
+        aus_historie = st.checkbox("Mietentwicklung Spanien aus Mietpreis-Historie Barcelona schätzen", value=True,
+                                   key="mc_historie")
+        miete_es_drift = st.slider("Mietentwicklung Spanien (%/Jahr)", -5.0, 10.0, standard.rent_es_drift,
+                                   key="mc_miete_es", disabled=aus_historie)
+        miete_es_vol = st.slider("Mietvolatilität Spanien (%/Jahr)", 0.0, 20.0, standard.rent_es_volatility,
+                                 key="mc_miete_es_vol", disabled=aus_historie)
+    with col3:
+        leb_drift = st.slider("Teuerung Lebenshaltung (%/Jahr)", -2.0, 10.0, standard.living_drift, key="mc_leb")
+        leb_vol = st.slider("Volatilität Lebenshaltung (%/Jahr)", 0.0, 10.0, standard.living_volatility,
+                            key="mc_leb_vol")
+        fx_vol = st.slider("Wechselkursvolatilität CHF/EUR (%/Jahr)", 0.0, 20.0, standard.fx_volatility,
+                           key="mc_fx_vol")
+
+    konfiguration = SimulationConfig(scenarios=int(szenarien), years=jahre, seed=int(seed),
+                                     rent_ch_drift=miete_ch_drift, rent_ch_volatility=miete_ch_vol,
+                                     rent_es_drift=miete_es_drift, rent_es_volatility=miete_es_vol,
+                                     living_drift=leb_drift, living_volatility=leb_vol, fx_volatility=fx_vol)
+    if aus_historie:
+        konfiguration = with_fitted_rent(konfiguration, load_store())
+        st.caption(f"Geschätzt aus der Mietpreis-Historie Barcelona: {konfiguration.rent_es_drift:.2f}%/Jahr, "
+                   f"Volatilität {konfiguration.rent_es_volatility:.2f}%/Jahr")
+
+    simulation = simulate(eingaben, konfiguration, steuern)
+    baender = percentile_bands(simulation["sparpotenzial_diff"])
+    wahrscheinlichkeit = probability_es_better(simulation)
+    st.metric("Wahrscheinlichkeit, dass Spanien beim Sparpotenzial vorne liegt (letztes Jahr)",
+              f"{wahrscheinlichkeit[-1] * 100:.1f}%")
+
+    fig = go.Figure([
+        go.Scatter(x=baender.index, y=baender["P95"], line={"width": 0}, showlegend=False, hoverinfo="skip"),
+        go.Scatter(x=baender.index, y=baender["P5"], fill="tonexty", line={"width": 0}, name="5–95%"),
+        go.Scatter(x=baender.index, y=baender["P75"], line={"width": 0}, showlegend=False, hoverinfo="skip"),
+        go.Scatter(x=baender.index, y=baender["P25"], fill="tonexty", line={"width": 0}, name="25–75%"),
+        go.Scatter(x=baender.index, y=baender["P50"], line={"color": "black"}, name="Median"),
+    ])
+    fig.add_hline(y=0, line_dash="dot")
+    fig.update_layout(title="Sparpotenzial Schweiz minus Spanien (EUR)", xaxis_title="Jahr",
+                      yaxis_title="Differenz Sparpotenzial (CH − ES)")
+    st.plotly_chart(fig, use_container_width=True)
+
+    tabelle = baender.copy()
+    tabelle["P(Spanien besser)"] = wahrscheinlichkeit * 100
+    st.dataframe(tabelle.round(1), use_container_width=True)
+
 # Optionale weitere Kriterien:
 # Hier können noch mehr Kriterien oder Gewichtungen eingeführt werden,
 # um eine Gesamtbewertung abzugeben.
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_DIR, read_metadata
+
+TAX_DIR = os.path.join(DATA_DIR, 'tax_brackets')
+
+# Income tax tables summed per country: Swiss federal + Zurich, Spanish state + Catalan IRPF
+TAX_SYSTEMS = {
+    'ch': ('ch_federal', 'zh_cantonal'),
+    'es': ('es_state', 'es_catalonia'),
+}
+
+_lock = threading.Lock()
+_schedules = {}
+
+
+class TaxSchedule:
+    """A marginal-rate bracket table evaluated for whole income arrays at once.
+
+    The tax owed at each bracket's lower bound is precomputed, so evaluating an
+    income is one np.searchsorted for its bracket plus the marginal part above it.
+    """
+
+    def __init__(self, name, lower, rates, multiplier=1.0, max_average_rate=None, allowance=0.0, metadata=None):
+        self.name = name
+        self.lower = np.asarray(lower, dtype=float)
+        self.rates = np.asarray(rates, dtype=float) / 100
+        if self.lower[0] != 0 or (np.diff(self.lower) <= 0).any():
+            raise ValueError(f'{name}: bracket lower bounds must start at 0 and increase')
+        self.cumulative = np.concatenate([[0.0], np.cumsum(np.diff(self.lower) * self.rates[:-1])])
+        self.multiplier = float(multiplier)
+        self.max_average_rate = None if max_average_rate is None else float(max_average_rate) / 100
+        self.allowance = float(allowance)
+        self.metadata = metadata or {}
+
+    def scale(self, income):
+        """Tax from the bracket table alone, before multiplier, allowance and cap."""
+        income = np.maximum(np.asarray(income, dtype=float), 0)
+        bracket = np.searchsorted(self.lower, income, side='right') - 1
+        return self.cumulative[bracket] + (income - self.lower[bracket]) * self.rates[bracket]
+
+    def __call__(self, income):
+        income = np.maximum(np.asarray(income, dtype=float), 0)
+        tax = self.scale(income)
+        if self.allowance:
+            # Spanish mínimo personal: the allowance is taxed at scale rates and credited back
+            tax = np.maximum(tax - self.scale(np.minimum(income, self.allowance)), 0)
+        tax = tax * self.multiplier
+        if self.max_average_rate is not None:
+            tax = np.minimum(tax, income * self.max_average_rate)
+        return tax
+
+    def marginal_rate(self, income, step=1.0):
+        """Marginal rate in % at each income (numerical, so the cap and allowance are included)."""
+        income = np.asarray(income, dtype=float)
+        return (self(income + step) - self(income)) / step * 100
+
+    def average_rate(self, income):
+        income = np.asarray(income, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(income > 0, self(income) / income * 100, 0.0)
+
+
+class TaxSystem:
+    """Sum of several schedules levied on the same taxable income."""
+
+    def __init__(self, schedules):
+        self.schedules = list(schedules)
+
+    def __call__(self, income):
+        return sum(schedule(income) for schedule in self.schedules)
+
+    def average_rate(self, income):
+        income = np.asarray(income, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(income > 0, self(income) / income * 100, 0.0)
+
+
+def _optional_float(metadata, key, default=None):
+    value = metadata.get(key, '')
+    return float(value) if value else default
+
+
+def read_schedule(name, tax_dir=TAX_DIR):
+    """Read data/tax_brackets/<name>/Brackets.csv and its Metadata.txt."""
+    directory = os.path.join(tax_dir, name)
+    brackets = pd.read_csv(os.path.join(directory, 'Brackets.csv'))
+    metadata = read_metadata(os.path.join(directory, 'Metadata.txt'))
+    return TaxSchedule(name, brackets['Lower bound'], brackets['Marginal rate (%)'],
+                       multiplier=_optional_float(metadata, 'multiplier', 1.0),
+                       max_average_rate=_optional_float(metadata, 'max average rate'),
+                       allowance=_optional_float(metadata, 'personal allowance', 0.0),
+                       metadata=metadata)
+
+
+def load_schedule(name, tax_dir=TAX_DIR):
+    key = (name, tax_dir)
+    with _lock:
+        if key not in _schedules:
+            _schedules[key] = read_schedule(name, tax_dir=tax_dir)
+        return _schedules[key]
+
+
+def tax_system(country, tax_dir=TAX_DIR):
+    """Combined income tax of a country ('ch' or 'es') as a callable on taxable income."""
+    return TaxSystem(load_schedule(name, tax_dir=tax_dir) for name in TAX_SYSTEMS[country])
@@ -0,0 +1,94 @@
+"""Data-quality checks run once when the exports are ingested.
+
+Every cell of every export is classified from its raw text while it is parsed
+(data_loader.classify), so the '-' (missing) and '..' (suppressed for privacy)
+markers described in Metadata.txt stay distinguishable, and the values checked
+here are the ones the panels use. Numeric values are then checked against each
+dataset's plausible range and for jumps between consecutive observations of a
+territory, all as whole-array operations. The resulting report is small and
+travels with the store snapshot.
+"""
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_DIR, DATASETS, INVALID, MISSING, SUPPRESSED, VALID, load_status, load_table, period_columns
+from indicators import PANELS
+
+# Consecutive observations of a territory more than this factor apart are reported as jumps
+JUMP_FACTOR = 3.0
+# Counts this small swing by more than that routinely (1 -> 5 transactions), so they are not checked
+JUMP_MIN_COUNT = 20
+# Issues kept per dataset and rule in the report
+MAX_ISSUES = 20
+
+
+def range_rules():
+    """Plausible (low, high) range of every dataset: non-negative, narrowed by the panels' bounds."""
+    rules = {name: (0, np.inf) for name in DATASETS}
+    for spec in PANELS:
+        if spec.bounds is not None and len(spec.sources) == 1:
+            rules[spec.sources[0]] = spec.bounds
+    return rules
+
+
+def jumps(values, floor=0):
+    """True where a value differs from the row's previous observation by more than JUMP_FACTOR.
+
+    Pairs where both values are below `floor` are ignored.
+    """
+    previous = pd.DataFrame(values).T.ffill().shift().T.to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = values / previous
+    return ((ratio > JUMP_FACTOR) | (ratio < 1 / JUMP_FACTOR)) & (np.fmax(values, previous) >= floor)
+
+
+def issue_list(mask, values, territories, periods, rule):
+    rows, columns = np.nonzero(mask)
+    return [{'territory': territories[row], 'period': periods[column], 'value': float(values[row, column]),
+             'rule': rule} for row, column in zip(rows[:MAX_ISSUES], columns[:MAX_ISSUES])]
+
+
+def validate_dataset(name, data_dir=DATA_DIR, rules=None):
+    """Quality report of one export: cell counts by status, range violations and jumps."""
+    table, status = load_table(name, data_dir=data_dir), load_status(name, data_dir=data_dir)
+    periods = period_columns(table)
+    territories = table['Territory'].to_numpy()
+    if 'Property use typology' in table:
+        territories = territories + ' / ' + table['Property use typology'].to_numpy()
+    values = table[periods].to_numpy(dtype=float)
+
+    low, high = (rules or range_rules())[name]
+    out_of_range = (values < low) | (values > high)
+    observed = values[~np.isnan(values)]
+    counts_only = bool((observed == np.round(observed)).all())
+    jumped = jumps(values, JUMP_MIN_COUNT if counts_only else 0)
+    counts = np.bincount(status.ravel(), minlength=4)
+    return {
+        'cells': int(status.size),
+        'valid': int(counts[VALID]),
+        'missing': int(counts[MISSING]),
+        'suppressed': int(counts[SUPPRESSED]),
+        'invalid': int(counts[INVALID]),
+        'out_of_range': int(out_of_range.sum()),
+        'jumps': int(jumped.sum()),
+        'range': [low, None if np.isinf(high) else high],
+        'issues': (issue_list(out_of_range, values, territories, periods, 'out of range')
+                   + issue_list(jumped, values, territories, periods, f'jump over x{JUMP_FACTOR:g}')),
+    }
+
+
+def validate_exports(data_dir=DATA_DIR):
+    rules = range_rules()
+    return {name: validate_dataset(name, data_dir, rules) for name in DATASETS}
+
+
+def summary_frame(quality):
+    """One row of counts per dataset, for display."""
+    columns = ['cells', 'valid', 'missing', 'suppressed', 'invalid', 'out_of_range', 'jumps']
+    return pd.DataFrame([[report[column] for column in columns] for report in quality.values()],
+                        index=pd.Index(list(quality), name='Dataset'), columns=columns)
+
+
+def issues_frame(quality):
+    rows = [{'dataset': name, **issue} for name, report in quality.items() for issue in report['issues']]
+    return pd.DataFrame(rows, columns=['dataset', 'territory', 'period', 'value', 'rule'])
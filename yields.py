@@ -0,0 +1,129 @@
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_loader import ALL_LEVELS
+
+RENT_DATASET = 'rental_price'
+PRICE_DATASET = 'transaction_price'
+METRICS = ('gross', 'net', 'payback', 'price_to_rent')
+# Assumption sets kept per data version (sl_move's 'Annahmen Nettorendite' inputs can produce many)
+MAX_CACHED = 32
+
+_lock = threading.Lock()
+_yields = {}
+
+
+@dataclass(frozen=True)
+class YieldAssumptions:
+    """Costs of letting a flat bought at the average price, all per m².
+
+    Percentages are in % (5.0 is 5%). The defaults describe a resale flat in
+    Barcelona: 10% ITP transfer tax (new builds pay 10% IVA plus 1.5% AJD instead).
+    """
+    vacancy: float = 5.0
+    # IBI property tax, as % of the purchase price per year
+    ibi: float = 0.3
+    # Community fees in € per m² per month
+    community_fees: float = 2.0
+    # Insurance, repairs and management, as % of the rent collected
+    maintenance: float = 5.0
+    purchase_tax: float = 10.0
+    # Notary, registry and agency fees, as % of the price
+    purchase_costs: float = 2.0
+
+
+class YieldMatrix:
+    """Gross and net yield, payback period and price-to-rent ratio as territory x period arrays.
+
+    `rent` is the monthly rent and `price` the purchase price, both per m² and
+    aligned on the same territories and dates. Every metric is computed for all
+    territories and periods at once.
+    """
+
+    def __init__(self, territories, dates, rent, price, assumptions=YieldAssumptions()):
+        self.territories = list(territories)
+        self.index = {territory: row for row, territory in enumerate(self.territories)}
+        self.dates = pd.DatetimeIndex(dates)
+        self.years = self.dates.year.to_numpy()
+        self.assumptions = assumptions
+        self.rent = np.array(rent, dtype=float)
+        self.price = np.array(price, dtype=float)
+
+        a = assumptions
+        yearly_rent = self.rent * 12
+        income = yearly_rent * (1 - a.vacancy / 100) * (1 - a.maintenance / 100)
+        costs = a.community_fees * 12 + self.price * a.ibi / 100
+        invested = self.price * (1 + (a.purchase_tax + a.purchase_costs) / 100)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.gross = yearly_rent / self.price * 100
+            self.net = (income - costs) / invested * 100
+            # Years of net rent needed to recover the total outlay; undefined without positive net income
+            self.payback = np.where(self.net > 0, 100 / self.net, np.nan)
+            self.price_to_rent = self.price / yearly_rent
+        for array in (self.rent, self.price, self.gross, self.net, self.payback, self.price_to_rent):
+            array[~np.isfinite(array)] = np.nan
+            array.setflags(write=False)
+
+        # Latest period where both rent and price are known, -1 when never
+        valid = ~np.isnan(self.gross)
+        self.last = np.where(valid.any(axis=1), valid.shape[1] - 1 - valid[:, ::-1].argmax(axis=1), -1)
+
+    def __contains__(self, territory):
+        return territory in self.index
+
+    def frame(self, metric):
+        """Date x Territory frame of one metric ('gross', 'net', 'payback' or 'price_to_rent')."""
+        frame = pd.DataFrame(getattr(self, metric).T, index=self.dates, columns=self.territories)
+        frame.index.name = 'Date'
+        frame.columns.name = 'Territory'
+        return frame
+
+    def latest(self, territory):
+        """Every metric for a territory's latest year with both rent and price data, or None."""
+        row = self.index.get(territory)
+        if row is None or self.last[row] < 0:
+            return None
+        column = self.last[row]
+        values = {metric: float(getattr(self, metric)[row, column]) for metric in ('rent', 'price') + METRICS}
+        values['year'] = int(self.years[column])
+        return values
+
+    def latest_values(self, metric, territories):
+        """`metric` in each territory's latest year with data, NaN where unknown (vectorized)."""
+        rows = np.array([self.index.get(territory, -1) for territory in territories], dtype=int)
+        last = np.where(rows >= 0, self.last[np.maximum(rows, 0)], -1)
+        observed = last >= 0
+        values = getattr(self, metric)[np.maximum(rows, 0), np.maximum(last, 0)]
+        return np.where(observed, values, np.nan)
+
+
+def build_yields(store, assumptions=YieldAssumptions(), levels=ALL_LEVELS, freq='A', how='first'):
+    rent = store.series(RENT_DATASET, levels=levels, freq=freq, how=how)
+    price = store.series(PRICE_DATASET, levels=levels, freq=freq, how=how)
+    dates = rent.index.intersection(price.index)
+    territories = rent.columns.intersection(price.columns)
+    return YieldMatrix(territories, dates, rent.loc[dates, territories].to_numpy().T,
+                       price.loc[dates, territories].to_numpy().T, assumptions)
+
+
+def yield_matrix(store, assumptions=YieldAssumptions(), levels=ALL_LEVELS, freq='A', how='first'):
+    """Cached yields for every territory; rebuilt when rents, prices or the assumptions change."""
+    digests = (store.digests[RENT_DATASET], store.digests[PRICE_DATASET])
+    key = (digests, assumptions, tuple(levels), freq, how)
+    with _lock:
+        if key not in _yields:
+            for stale in [cached for cached in _yields if cached[0] != digests]:
+                del _yields[stale]
+            while len(_yields) >= MAX_CACHED:
+                del _yields[next(iter(_yields))]
+            _yields[key] = build_yields(store, assumptions, levels, freq, how)
+        return _yields[key]
+
+
+def clear_cache():
+    """Drop every cached YieldMatrix (the benchmarks time the build itself)."""
+    with _lock:
+        _yields.clear()